@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+缩略图提取耗时对比
+比较精确模式（输出端 -ss，从头解码）与快速模式（输入端 -ss，只解码关键帧）的延迟
+
+用法:
+    python benchmark_thumbnail.py video1.mp4 [video2.mp4 ...] [--repeat 3]
+"""
+
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from thumbnail_extractor import ThumbnailExtractor
+
+
+def time_command(extractor, video_path, output_path, timestamp, fast, repeat):
+    """多次执行提取命令，返回(各次耗时列表, 是否成功)"""
+    timings = []
+    ok = False
+    for _ in range(repeat):
+        if output_path.exists():
+            output_path.unlink()
+        cmd = extractor.build_ffmpeg_command(video_path, output_path, timestamp, fast)
+        start = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        ok = result.returncode == 0 and output_path.exists() and output_path.stat().st_size > 0
+    return timings, ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="缩略图提取耗时对比（精确模式 vs 快速模式）")
+    ap.add_argument("videos", nargs="+", help="视频文件路径")
+    ap.add_argument("--repeat", type=int, default=3, help="每个文件每种模式的重复次数")
+    ap.add_argument("--timestamp", default=None, help="固定提取时间点，默认按时长的10%%选择")
+    args = ap.parse_args()
+
+    extractor = ThumbnailExtractor(thumbnail_dir=tempfile.mkdtemp(prefix="thumb_bench_"))
+    if not extractor.ffmpeg_available:
+        print("ffmpeg不可用，无法进行测试")
+        return
+
+    totals = {"精确": [], "快速": []}
+    print(f"{'文件':<40} {'时间点':>10} {'精确(秒)':>10} {'快速(秒)':>10} {'加速比':>8}")
+    for video in args.videos:
+        video_path = Path(video)
+        if not video_path.exists():
+            print(f"视频文件不存在: {video_path}")
+            continue
+        timestamp = args.timestamp or extractor.pick_timestamp(extractor._probe_duration(video_path))
+        output_path = extractor.thumbnail_dir / f"{video_path.stem}_bench.jpg"
+
+        accurate, accurate_ok = time_command(extractor, video_path, output_path, timestamp, False, args.repeat)
+        fast, fast_ok = time_command(extractor, video_path, output_path, timestamp, True, args.repeat)
+        accurate_median = statistics.median(accurate)
+        fast_median = statistics.median(fast)
+        totals["精确"].append(accurate_median)
+        totals["快速"].append(fast_median)
+
+        flags = "" if accurate_ok and fast_ok else f"  (精确:{'成功' if accurate_ok else '失败'} 快速:{'成功' if fast_ok else '失败'})"
+        speedup = accurate_median / fast_median if fast_median > 0 else 0
+        print(f"{video_path.name[:40]:<40} {timestamp:>10} {accurate_median:>10.3f} {fast_median:>10.3f} {speedup:>7.1f}x{flags}")
+
+    if totals["快速"]:
+        accurate_sum = sum(totals["精确"])
+        fast_sum = sum(totals["快速"])
+        print(f"\n合计: 精确 {accurate_sum:.3f}s  快速 {fast_sum:.3f}s  加速比 {accurate_sum / fast_sum if fast_sum else 0:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,23 @@ import re
 import json
 import time
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
 from playwright.sync_api import sync_playwright
 import threading
 import csv
+import sqlite3
 from datetime import datetime, timedelta
 import sys
 import shutil
 import subprocess
 import calendar
 import re as _re
+import queue
+import atexit
+try:
+    import orjson
+except ImportError:
+    orjson = None
 PATTERNS = [
     re.compile(r'https://(.*?).douyin.com/aweme/v1/web/aweme/post/'),
     re.compile(r'https://www.douyin.com/aweme/v1/web/general/search/single/'),
@@ -22,6 +28,12 @@ PATTERNS = [
     re.compile(r'https://www.douyin.com/aweme/v1/web/aweme/listcollection/')
 ]
 
+# 精简采集：只需要列表接口的 JSON，图片、视频、字体和统计上报都可以拦截
+BLOCK_RESOURCE_TYPES = {'image', 'media', 'font'}
+TRACKER_HOSTS = ('mcs.zijieapi.com', 'mon.zijieapi.com', 'mon.snssdk.com', 'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'hm.baidu.com')
+LEAN_VIEWPORT = {'width': 800, 'height': 600}
+LEAN_ARGS = ['--autoplay-policy=user-gesture-required', '--mute-audio']
+
 UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
 
 def safe(s):
@@ -96,69 +108,187 @@ def parse_douyin_item(data, host_index=1):
             'publish_time': publish_str,
             'publish_ts': create_time}
 
+class ItemStore:
+    # 采集结果：按采集顺序保存作品，同时以 id 建索引，去重与按 id 查询均为 O(1)
+    def __init__(self):
+        self.items = []
+        self.by_id = {}
+        self.parser = None
+
+    def drain(self):
+        if self.parser is not None:
+            self.parser.drain()
+
+    def add(self, item):
+        aid = item.get('id')
+        if not aid or aid in self.by_id:
+            return False
+        self.by_id[aid] = item
+        self.items.append(item)
+        return True
+
+    def get(self, aid, default=None):
+        return self.by_id.get(aid, default)
+
+    def since(self, start):
+        return self.items[start:]
+
+    def __contains__(self, aid):
+        return aid in self.by_id
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+def apply_harvest_profile(context):
+    def handle_route(route):
+        req = route.request
+        try:
+            host = urlparse(req.url).netloc
+        except Exception:
+            host = ''
+        if req.resource_type in BLOCK_RESOURCE_TYPES or any(host.endswith(h) for h in TRACKER_HOSTS):
+            route.abort()
+        else:
+            route.continue_()
+    context.route('**/*', handle_route)
+
+def loads_json(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def extract_aweme_list(data):
+    # 只取出作品列表，其余字段（推荐、扩展信息等）随响应体一起丢弃
+    if 'aweme_list' in data and isinstance(data['aweme_list'], list):
+        return data['aweme_list']
+    if 'aweme_detail' in data:
+        return [data['aweme_detail']]
+    if 'data' in data and isinstance(data['data'], list):
+        return [x.get('aweme_info') for x in data['data'] if isinstance(x, dict) and x.get('aweme_info')]
+    if 'detail' in data:
+        return [data['detail']]
+    return []
+
+def allow_item(item, control):
+    if not control:
+        return True
+    th = control.get('threshold_ts')
+    last_day = bool(control.get('last_day'))
+    stop_on_older = bool(control.get('stop_on_older'))
+    ts = item.get('publish_ts')
+    if th is None and last_day:
+        th = int(time.time()) - 86400
+    if th is None:
+        return True
+    if ts is None or ts < th:
+        if stop_on_older:
+            control['stop'] = True
+        return False
+    return True
+
+class FeedParser:
+    # 列表响应解析线程：回调只读取响应体并入队，解析 JSON、提取作品与日期过滤都在这里完成；
+    # 先加入作品再更新 control['responses']，等待响应的一方看到计数变化时作品已可用
+    def __init__(self, items, host_index=1, control=None):
+        self.items = items
+        self.host_index = host_index
+        self.control = control
+        self.q = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, url, body):
+        self.q.put((url, body))
+
+    def drain(self):
+        self.q.join()
+
+    def close(self):
+        self.q.put(None)
+
+    def _run(self):
+        while True:
+            entry = self.q.get()
+            try:
+                if entry is None:
+                    return
+                self._handle(*entry)
+            except Exception:
+                pass
+            finally:
+                self.q.task_done()
+
+    def _handle(self, url, body):
+        try:
+            data = loads_json(body)
+        except Exception:
+            return
+        if not data or not isinstance(data, dict):
+            return
+        control = self.control
+        for d in extract_aweme_list(data):
+            if not d:
+                continue
+            item = parse_douyin_item(d, host_index=self.host_index)
+            if allow_item(item, control):
+                self.items.add(item)
+        if control is not None and 'has_more' in data:
+            # 记录分页状态：是否还有更多、下一页游标、第一个可翻页的作品列表请求，最后更新响应计数
+            control['has_more'] = bool(data.get('has_more'))
+            if 'max_cursor' in data:
+                control['cursor'] = data.get('max_cursor')
+            if not control.get('feed_url') and (PATTERNS[0].search(url) or PATTERNS[3].search(url)):
+                control['feed_url'] = url
+            control['responses'] = control.get('responses', 0) + 1
+
 def collect_items(page, host_index=1, control=None):
-    items = []
+    items = ItemStore()
+    parser = items.parser = FeedParser(items, host_index=host_index, control=control)
     def handle_response(response):
         url = response.url
         if not any(p.search(url) for p in PATTERNS):
             return
-        data = None
+        # 先按状态码与内容类型过滤，再一次性读取响应体交给解析线程
+        if response.status != 200:
+            return
+        ctype = (response.headers.get('content-type') or '').lower()
+        if ctype and 'json' not in ctype and 'text/plain' not in ctype:
+            return
         try:
-            data = response.json()
+            body = response.body()
         except Exception:
-            try:
-                txt = response.text()
-                data = json.loads(txt)
-            except Exception:
-                data = None
-        if not data:
             return
-        lists = []
-        if isinstance(data, dict):
-            if 'aweme_list' in data and isinstance(data['aweme_list'], list):
-                lists = data['aweme_list']
-            elif 'aweme_detail' in data:
-                lists = [data['aweme_detail']]
-            elif 'data' in data and isinstance(data['data'], list):
-                lists = [x.get('aweme_info') for x in data['data'] if isinstance(x, dict) and x.get('aweme_info')]
-            elif 'detail' in data:
-                lists = [data['detail']]
-        for d in lists:
-            if not d:
-                continue
-            item = parse_douyin_item(d, host_index=host_index)
-            allow = True
-            if control:
-                th = control.get('threshold_ts')
-                last_day = bool(control.get('last_day'))
-                stop_on_older = bool(control.get('stop_on_older'))
-                ts = item.get('publish_ts')
-                if th is not None:
-                    if ts is None or ts < th:
-                        allow = False
-                        if stop_on_older:
-                            control['stop'] = True
-                    else:
-                        allow = True
-                elif last_day:
-                    now_th = int(time.time()) - 86400
-                    if ts is None or ts < now_th:
-                        allow = False
-                        if stop_on_older:
-                            control['stop'] = True
-                    else:
-                        allow = True
-            if allow and item.get('id') and not any(x['id'] == item['id'] for x in items):
-                items.append(item)
+        if body:
+            parser.put(url, body)
     page.on('response', handle_response)
+    page.on('close', lambda _: parser.close())
     return items
 
-def autoscroll(page, items, max_idle=10, interval_ms=2000, container_selector='.route-scroll-container', control=None):
+def wait_for_feed_response(page, items, control, seen, timeout_ms, step_ms=50):
+    # 等待新的列表响应被 handle_response 处理完；有 control 时按响应计数判断，否则按作品数
+    waited = 0
+    while waited < timeout_ms:
+        page.wait_for_timeout(step_ms)
+        waited += step_ms
+        cur = control.get('responses', 0) if control is not None else len(items)
+        if cur != seen:
+            return True
+    return False
+
+def autoscroll(page, items, max_idle=10, interval_ms=2000, container_selector='.route-scroll-container', control=None, on_progress=None):
+    # 事件驱动：滚动后等待新的列表响应（最长 interval_ms），响应一到立即继续滚动；
+    # 响应中 has_more 为假时结束；等不到响应的轮次计为空闲，连续 max_idle 轮后结束
     idle = 0
-    last = 0
     while idle < max_idle:
-        if control and control.get('stop'):
+        if control and (control.get('stop') or control.get('has_more') is False):
             break
+        seen = control.get('responses', 0) if control is not None else len(items)
         container = None
         try:
             container = page.query_selector(container_selector)
@@ -168,13 +298,72 @@ def autoscroll(page, items, max_idle=10, interval_ms=2000, container_selector='.
             page.evaluate('el => el.scrollTop = el.scrollHeight', container)
         else:
             page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-        time.sleep(max(0.001, interval_ms/1000.0))
-        cur = len(items)
-        if cur == last:
-            idle += 1
+        arrived = wait_for_feed_response(page, items, control, seen, max(1, int(interval_ms)))
+        if on_progress:
+            on_progress()
+        idle = 0 if arrived else idle + 1
+
+FETCH_PAGE_JS = '''(url) => new Promise((resolve) => {
+    const x = new XMLHttpRequest();
+    x.open('GET', url, true);
+    x.withCredentials = true;
+    x.onload = () => {
+        try {
+            const d = JSON.parse(x.responseText || '{}');
+            resolve({status: x.status, has_more: !!d.has_more, max_cursor: d.max_cursor, count: (d.aweme_list || []).length});
+        } catch (e) {
+            resolve({status: x.status, has_more: null, max_cursor: null, count: 0});
+        }
+    };
+    x.onerror = () => resolve({status: 0, has_more: null, max_cursor: null, count: 0});
+    x.send();
+})'''
+
+def next_page_url(feed_url, cursor):
+    # 替换游标并去掉旧签名参数，由页面内的请求钩子重新签名
+    parts = urlsplit(feed_url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in ('max_cursor', 'a_bogus', 'X-Bogus')]
+    query.append(('max_cursor', str(cursor)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+def harvest_api(page, control, min_interval_ms=300, max_interval_ms=5000, max_failures=5, first_response_timeout_ms=30000, on_progress=None):
+    # 直接翻页采集：等到第一个作品列表响应后，在页面内用 XHR 按 max_cursor/has_more 重放请求，
+    # 复用浏览器的签名与 Cookie；返回数据则缩短间隔，失败或被限流则加倍退避。
+    # 返回 False 表示未能完成翻页（没有捕获到可翻页的请求或连续失败），调用方可改用滚动采集
+    waited = 0
+    while not control.get('feed_url') and waited < first_response_timeout_ms:
+        page.wait_for_timeout(200)
+        waited += 200
+    if not control.get('feed_url'):
+        return False
+    interval = min_interval_ms
+    failures = 0
+    while control.get('has_more') and not control.get('stop'):
+        url = next_page_url(control['feed_url'], control.get('cursor') or 0)
+        try:
+            res = page.evaluate(FETCH_PAGE_JS, url)
+        except Exception:
+            res = {'status': 0, 'has_more': None, 'max_cursor': None, 'count': 0}
+        if res.get('status') == 200 and res.get('has_more') is not None:
+            failures = 0
+            control['has_more'] = bool(res['has_more'])
+            if res.get('max_cursor') is not None:
+                control['cursor'] = res['max_cursor']
+            if res.get('count'):
+                interval = max(min_interval_ms, int(interval * 0.8))
+            else:
+                interval = min(max_interval_ms, interval * 2)
         else:
-            last = cur
-            idle = 0
+            failures += 1
+            interval = min(max_interval_ms, interval * 2)
+            print(f"翻页请求失败 status={res.get('status')}，{interval}ms 后重试（{failures}/{max_failures}）")
+            if failures >= max_failures:
+                return False
+        # 等待期间处理响应事件，作品由 handle_response 收集
+        page.wait_for_timeout(interval)
+        if on_progress:
+            on_progress()
+    return True
 
 def download_requests(url, path, headers, retry):
     for i in range(retry + 1):
@@ -191,8 +380,78 @@ def download_requests(url, path, headers, retry):
         time.sleep(1)
     return False
 
-def download_aria2(url, name, save_dir, headers, host='127.0.0.1', port=6800, secret='', max_conn=None, split=None, min_split_size=None):
-    rpc = f'http://{host}:{port}/jsonrpc'
+ARIA2_STATUS_KEYS = ['gid', 'status', 'completedLength', 'totalLength', 'errorCode']
+
+class Aria2Client:
+    # aria2 JSON-RPC：整个运行共用一个 requests.Session（保持连接），多个调用通过 system.multicall 合并为一次请求
+    def __init__(self, host='127.0.0.1', port=6800, secret='', timeout=10):
+        self.url = f'http://{host}:{port}/jsonrpc'
+        self.secret = secret
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _params(self, params):
+        params = list(params or [])
+        if self.secret:
+            params.insert(0, f'token:{self.secret}')
+        return params
+
+    def call(self, method, params=None):
+        # system.* 方法不接受 token 参数，token 写在 multicall 的每个子调用里
+        if not method.startswith('system.'):
+            params = self._params(params)
+        payload = {'jsonrpc': '2.0', 'id': method, 'method': method, 'params': list(params or [])}
+        try:
+            r = self.session.post(self.url, json=payload, timeout=self.timeout)
+            if r.status_code == 200:
+                return r.json().get('result')
+        except Exception:
+            return None
+        return None
+
+    def multicall(self, calls):
+        # calls: [(method, params), ...]；返回与 calls 对应的结果列表，失败的调用为 None
+        if not calls:
+            return []
+        batch = [{'methodName': m, 'params': self._params(p)} for m, p in calls]
+        res = self.call('system.multicall', [batch])
+        if not isinstance(res, list):
+            return [None] * len(calls)
+        return [r[0] if isinstance(r, list) and r else None for r in res]
+
+    def add_uris(self, entries, chunk=100):
+        # entries: [(url, options), ...]；返回对应的 gid 列表，提交失败的为 None
+        gids = []
+        for i in range(0, len(entries), chunk):
+            gids.extend(self.multicall([('aria2.addUri', [[url], opts]) for url, opts in entries[i:i + chunk]]))
+        return gids
+
+    def tell_all(self, keys=ARIA2_STATUS_KEYS, page=1000):
+        # 一次请求取回进行中、等待中与已结束的任务（只取 keys 中的字段）；列表满页时继续翻页
+        results = self.multicall([('aria2.tellActive', [keys]),
+                                  ('aria2.tellWaiting', [0, page, ['gid']]),
+                                  ('aria2.tellStopped', [0, page, keys])])
+        if any(r is None for r in results):
+            return None
+        active, waiting, stopped = results
+        for method, rows, row_keys in (('aria2.tellWaiting', waiting, ['gid']), ('aria2.tellStopped', stopped, keys)):
+            offset = len(rows)
+            while offset and offset % page == 0:
+                more = self.call(method, [offset, page, row_keys])
+                if not more:
+                    break
+                rows.extend(more)
+                offset += len(more)
+        return active, waiting, stopped
+
+    def remove_results(self, gids):
+        if gids:
+            self.multicall([('aria2.removeDownloadResult', [gid]) for gid in gids])
+
+    def change_global_option(self, options):
+        return self.call('aria2.changeGlobalOption', [options])
+
+def aria2_options(name, save_dir, headers, max_conn=None, split=None, min_split_size=None):
     hdr = [f'{k}: {v}' for k, v in headers.items()]
     opts = {'dir': save_dir, 'out': name, 'header': hdr}
     if max_conn:
@@ -205,19 +464,7 @@ def download_aria2(url, name, save_dir, headers, host='127.0.0.1', port=6800, se
     opts['allow-overwrite'] = 'true'
     opts['auto-file-renaming'] = 'false'
     opts['check-certificate'] = 'false'
-    params = [[url], opts]
-    if secret:
-        params.insert(0, f'token:{secret}')
-    payload = {'jsonrpc': '2.0', 'id': name, 'method': 'aria2.addUri', 'params': params}
-    try:
-        r = requests.post(rpc, json=payload, timeout=10)
-        if r.status_code == 200:
-            j = r.json()
-            if 'result' in j and j['result']:
-                return j['result']
-    except Exception:
-        pass
-    return False
+    return opts
 
 def human_bytes(n):
     units = ['B','KB','MB','GB','TB']
@@ -228,9 +475,9 @@ def human_bytes(n):
         i += 1
     return f"{f:.2f}{units[i]}"
 
-def build_jobs(items, save_dir, name_format):
+def build_jobs(items, save_dir, name_format, start_index=0):
     jobs = []
-    idx = 0
+    idx = start_index
     for it in items:
         urls = it['urls']
         if isinstance(urls, list):
@@ -260,47 +507,450 @@ def build_jobs(items, save_dir, name_format):
             jobs.append({'url': url, 'path': path, 'name': name + ext, 'id': it.get('id'), 'title': it.get('title'), 'author': it.get('author_name'), 'author_handle': it.get('author_handle',''), 'author_sec_uid': it.get('author_sec_uid', ''), 'publish_time': it.get('publish_time',''), 'page_url': it.get('url'), 'type': jtype, 'seq': 0, 'key': key})
     return jobs
 
-def read_history_map(history_path):
-    if not os.path.exists(history_path):
-        return {}, {}
-    m_key = {}
-    m_url = {}
-    try:
-        with open(history_path, 'r', encoding='utf-8', newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                url = row.get('url')
-                path = row.get('path')
-                key = row.get('key')
-                if key:
-                    m_key[key] = path
-                if url:
-                    m_url[url] = path
-    except Exception:
-        pass
-    return m_key, m_url
-
-def append_history(history_path, row):
-    head = ['timestamp', 'url', 'path', 'name', 'id', 'title', 'author', 'author_handle', 'publish_time', 'page_url', 'mode', 'bytes', 'status', 'key']
-    exists = os.path.exists(history_path)
-    os.makedirs(os.path.dirname(history_path), exist_ok=True)
-    with open(history_path, 'a', encoding='utf-8', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=head)
-        if not exists:
-            writer.writeheader()
-        writer.writerow({k: row.get(k, '') for k in head})
-
-def find_existing_by_id(save_dir, id_str):
-    if not id_str:
-        return None
-    try:
-        for root, _, files in os.walk(save_dir):
-            for nm in files:
-                if id_str in nm:
-                    return os.path.join(root, nm)
-    except Exception:
+HISTORY_DB = os.path.join('douyin_function', 'config', 'history.db')
+LEGACY_HISTORY_CSV = os.path.join('douyin_function', 'config', 'histroy.csv')
+
+class HistoryStore:
+    # 下载历史（SQLite）：每个资源一行，以 key（无 key 时用 url）去重并 upsert，url 与作品 id 建索引按需查询；
+    # 连接由采集线程与后写线程共用，访问加锁
+    def __init__(self, db_path=HISTORY_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS douyin_history (
+                dedupe_key TEXT PRIMARY KEY,
+                key TEXT,
+                url TEXT,
+                aweme_id TEXT,
+                type TEXT,
+                path TEXT,
+                name TEXT,
+                title TEXT,
+                author TEXT,
+                author_handle TEXT,
+                publish_time TEXT,
+                page_url TEXT,
+                mode TEXT,
+                bytes INTEGER,
+                status TEXT,
+                timestamp TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_douyin_history_url ON douyin_history(url)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_douyin_history_aweme ON douyin_history(aweme_id, type)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS douyin_history_meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def lookup(self, key=None, url=None, aweme_id=None):
+        # 依次按 key、url、作品 id（仅视频）查找已记录的保存路径
+        with self.lock:
+            if key:
+                row = self.conn.execute("SELECT path FROM douyin_history WHERE dedupe_key = ?", (key,)).fetchone()
+                if row:
+                    return row[0]
+            if url:
+                row = self.conn.execute("SELECT path FROM douyin_history WHERE url = ? LIMIT 1", (url,)).fetchone()
+                if row:
+                    return row[0]
+            if aweme_id:
+                row = self.conn.execute("SELECT path FROM douyin_history WHERE aweme_id = ? AND type = 'video' AND status <> 'failed' ORDER BY timestamp DESC LIMIT 1", (str(aweme_id),)).fetchone()
+                if row:
+                    return row[0]
         return None
-    return None
+
+    def write(self, rows):
+        if not rows:
+            return
+        values = []
+        for r in rows:
+            key = r.get('key') or ''
+            url = r.get('url') or ''
+            if not key and not url:
+                continue
+            # 旧 CSV 没有 type 列，从 key（id:type:seq）中取出
+            jtype = r.get('type') or (key.split(':')[1] if key.count(':') >= 2 else '')
+            try:
+                size = int(r.get('bytes') or 0)
+            except ValueError:
+                size = 0
+            values.append((key or url, key, url, str(r.get('id') or ''), jtype, r.get('path', ''), r.get('name', ''), r.get('title', ''),
+                           r.get('author', ''), r.get('author_handle', ''), r.get('publish_time', ''), r.get('page_url', ''),
+                           r.get('mode', ''), size, r.get('status', ''), r.get('timestamp', '')))
+        # skipped 只刷新路径与大小，不覆盖已有的下载状态；整批在一个事务中写入，失败时回滚
+        with self.lock, self.conn:
+            self.conn.executemany("""
+                INSERT INTO douyin_history (dedupe_key, key, url, aweme_id, type, path, name, title, author, author_handle,
+                                            publish_time, page_url, mode, bytes, status, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(dedupe_key) DO UPDATE SET
+                    url = excluded.url,
+                    path = excluded.path,
+                    name = excluded.name,
+                    bytes = excluded.bytes,
+                    mode = excluded.mode,
+                    status = CASE WHEN excluded.status = 'skipped' AND douyin_history.status <> '' THEN douyin_history.status ELSE excluded.status END,
+                    timestamp = excluded.timestamp
+            """, values)
+
+    def import_csv(self, csv_path, batch=1000):
+        # 一次性导入旧的 histroy.csv；已导入的文件记在 meta 表中，不会重复导入
+        csv_path = os.path.abspath(csv_path)
+        if not os.path.exists(csv_path):
+            return 0
+        with self.lock:
+            done = self.conn.execute("SELECT 1 FROM douyin_history_meta WHERE name = ?", (f'imported:{csv_path}',)).fetchone()
+        if done:
+            return 0
+        count = 0
+        try:
+            with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+                rows = []
+                for row in csv.DictReader(f):
+                    rows.append(row)
+                    if len(rows) >= batch:
+                        self.write(rows)
+                        count += len(rows)
+                        rows = []
+                self.write(rows)
+                count += len(rows)
+        except Exception as e:
+            print(f"导入历史记录失败: {e}")
+            return count
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO douyin_history_meta (name, value) VALUES (?, ?)", (f'imported:{csv_path}', datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            self.conn.commit()
+        print(f"已导入历史记录 {count} 行: {csv_path}")
+        return count
+
+    def close(self):
+        with self.lock:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+
+def open_history_store(db_path=HISTORY_DB, legacy_csv=LEGACY_HISTORY_CSV):
+    store = HistoryStore(db_path)
+    if legacy_csv:
+        store.import_csv(legacy_csv)
+    return store
+
+class HistoryWriter:
+    # 后写线程：收集历史行，每 flush_interval_ms 毫秒或满 max_batch 行在一个事务中批量 upsert，退出时自动刷新
+    def __init__(self, store, flush_interval_ms=500, max_batch=200):
+        self.store = store
+        self.flush_interval = max(0.001, flush_interval_ms / 1000.0)
+        self.max_batch = max(1, int(max_batch))
+        self.q = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def append(self, row):
+        self.q.put(('row', row))
+
+    def flush(self, timeout=None):
+        if self.closed or not self.thread.is_alive():
+            return False
+        done = threading.Event()
+        self.q.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        if self.closed:
+            return
+        self.flush(timeout)
+        self.closed = True
+        self.q.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            op = self.q.get()
+            if op is None:
+                break
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch and batch[-1][0] != 'flush':
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self.q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self.q.put(None)
+                    break
+                batch.append(nxt)
+            self._write([op[1] for op in batch if op[0] == 'row'])
+            for op in batch:
+                if op[0] == 'flush':
+                    op[1].set()
+
+    def _write(self, rows):
+        # 与 history_manager.HistoryWriteBehind 相同：整批失败（如数据库被锁）时逐条重试，避免整批丢失
+        if not rows:
+            return
+        try:
+            self.store.write(rows)
+        except sqlite3.Error as e:
+            print(f"批量写入历史记录失败，改为逐条写入: {e}")
+            for row in rows:
+                try:
+                    self.store.write([row])
+                except sqlite3.Error as row_error:
+                    print(f"写入历史记录失败: {row_error}")
+
+def history_row(job, mode, size, status, path=None):
+    return {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'url': job.get('url',''),
+        'path': job.get('path','') if path is None else path,
+        'name': job.get('name',''),
+        'id': job.get('id',''),
+        'title': job.get('title',''),
+        'author': job.get('author',''),
+        'author_handle': job.get('author_handle',''),
+        'publish_time': job.get('publish_time',''),
+        'page_url': job.get('page_url',''),
+        'mode': mode,
+        'bytes': str(size),
+        'status': status,
+        'key': job.get('key',''),
+        'type': job.get('type','')
+    }
+
+class RateLimiter:
+    # 令牌桶：限制所有下载线程合计的每秒字节数；rate<=0 表示不限速
+    def __init__(self, rate):
+        self.rate = float(rate or 0)
+        self.allowance = self.rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= n
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+class DownloadPipeline:
+    # 采集与下载并行：滚动过程中不断放入任务，后台线程同时下载；队列有界，下载跟不上时采集端等待
+    def __init__(self, mode, threads, retry, headers, stats, lock, history, queue_size=100, aria2=None, limiter=None):
+        self.mode = mode
+        self.limiter = limiter
+        self.retry = retry
+        self.headers = headers
+        self.stats = stats
+        self.lock = lock
+        self.history = history
+        self.aria2 = aria2 or {}
+        self.q = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.results = []
+        self.client = None
+        if mode == 'aria2c':
+            self.client = Aria2Client(self.aria2.get('host', '127.0.0.1'), self.aria2.get('port', 6800), self.aria2.get('secret', ''))
+            self.workers = [threading.Thread(target=self._run_aria2, daemon=True)]
+        else:
+            self.workers = [threading.Thread(target=self._run_requests, daemon=True) for _ in range(max(1, int(threads)))]
+        for t in self.workers:
+            t.start()
+
+    def put(self, job):
+        with self.lock:
+            self.stats['queued'] += 1
+        self.q.put(job)
+
+    def close(self):
+        for _ in self.workers:
+            self.q.put(None)
+        for t in self.workers:
+            t.join()
+        return self.results
+
+    def _run_requests(self):
+        while True:
+            job = self.q.get()
+            if job is None:
+                break
+            try:
+                ok = download_requests_job(job, self.headers, self.retry, self.stats, self.lock, self.history, self.limiter)
+            except Exception:
+                ok = False
+            with self.lock:
+                self.results.append(bool(ok))
+
+    def _fallback_requests(self, job):
+        try:
+            ok = download_requests_job(job, self.headers, self.retry, self.stats, self.lock, self.history, self.limiter)
+        except Exception:
+            ok = False
+        with self.lock:
+            self.results.append(bool(ok))
+
+    def _submit_aria2(self, jobs, gid_to_job):
+        # 一批任务通过 system.multicall 一次提交；提交失败的改用 requests 下载
+        a = self.aria2
+        entries = [(job['url'], aria2_options(job['name'], os.path.dirname(job['path']), self.headers, max_conn=a.get('max_conn'), split=a.get('split'), min_split_size=a.get('min_split_size'))) for job in jobs]
+        gids = self.client.add_uris(entries)
+        for job, gid in zip(jobs, gids):
+            if gid:
+                gid_to_job[gid] = {'job': job, 'bytes': 0}
+            else:
+                self._fallback_requests(job)
+
+    def _finish_aria2(self, entry, status, cl):
+        with self.lock:
+            if status == 'complete':
+                self.stats['completed'] += 1
+                self.results.append(True)
+                self.history.append(history_row(entry['job'], 'aria2c', cl, 'success'))
+            else:
+                self.stats['failed'] += 1
+                self.results.append(False)
+
+    def _poll_aria2(self, gid_to_job):
+        # 返回本轮是否有进展（字节增加或任务结束），用于调整轮询间隔
+        listing = self.client.tell_all()
+        if listing is None:
+            return False
+        active, waiting, stopped = listing
+        progressed = False
+        for st in active:
+            entry = gid_to_job.get(st.get('gid'))
+            if not entry:
+                continue
+            cl = int(st.get('completedLength', '0'))
+            if cl > entry['bytes']:
+                progressed = True
+                with self.lock:
+                    self.stats['bytes'] += cl - entry['bytes']
+                entry['bytes'] = cl
+        finished = []
+        for st in stopped:
+            gid = st.get('gid')
+            entry = gid_to_job.pop(gid, None)
+            if not entry:
+                continue
+            cl = int(st.get('completedLength', '0'))
+            with self.lock:
+                self.stats['bytes'] += max(0, cl - entry['bytes'])
+            self._finish_aria2(entry, st.get('status'), cl)
+            finished.append(gid)
+        # 三个列表里都找不到的任务（结果已被 aria2 清除）按失败处理
+        seen = {st.get('gid') for st in active} | {st.get('gid') for st in waiting}
+        for gid in [g for g in gid_to_job if g not in seen]:
+            self._finish_aria2(gid_to_job.pop(gid), 'removed', 0)
+            progressed = True
+        self.client.remove_results(finished)
+        return progressed or bool(finished)
+
+    def _run_aria2(self, batch_size=100, min_interval=0.5, max_interval=5.0):
+        # 单线程：攒一批任务提交到 aria2，同时轮询进行中的任务；有进展时按最短间隔轮询，
+        # 没有变化时间隔逐步加倍到 max_interval；队列关闭且任务全部结束后退出
+        gid_to_job = {}
+        closed = False
+        interval = min_interval
+        last_poll = time.monotonic()
+        while not closed or gid_to_job:
+            if not closed:
+                batch = []
+                try:
+                    batch.append(self.q.get(timeout=min_interval))
+                    while len(batch) < batch_size:
+                        batch.append(self.q.get_nowait())
+                except queue.Empty:
+                    pass
+                if None in batch:
+                    closed = True
+                    batch = [j for j in batch if j is not None]
+                if batch:
+                    self._submit_aria2(batch, gid_to_job)
+            else:
+                time.sleep(max(0.0, interval - (time.monotonic() - last_poll)))
+            if gid_to_job and time.monotonic() - last_poll >= interval:
+                progressed = self._poll_aria2(gid_to_job)
+                interval = min_interval if progressed else min(max_interval, interval * 2)
+                last_poll = time.monotonic()
+
+ID_IN_NAME = re.compile(r'\d{12,}')
+AWEME_ID_LEN = 19
+
+class FileIdIndex:
+    # 作品 id -> 文件路径：首次查询时用 os.scandir 遍历一次保存目录（含子目录）。
+    # 文件名中每段 12 位以上的数字连同其中每个 19 位窗口都登记为候选 id，
+    # 模板让 id 与其它数字相连（如 {时间}{id}）时也能命中；之后的查询与登记都是字典操作。
+    # 非 19 位的 id 查不到时，再在各数字段中做子串匹配，与原来的文件名包含判断一致
+    def __init__(self, root):
+        self.root = root
+        self.by_id = {}
+        self.runs = []
+        self.built = False
+        self.lock = threading.Lock()
+
+    def _add_run(self, run, path):
+        self.by_id.setdefault(run, path)
+        self.runs.append((run, path))
+        for i in range(len(run) - AWEME_ID_LEN + 1):
+            self.by_id.setdefault(run[i:i + AWEME_ID_LEN], path)
+
+    def _build(self):
+        stack = [self.root]
+        while stack:
+            d = stack.pop()
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file():
+                                for run in ID_IN_NAME.findall(entry.name):
+                                    self._add_run(run, entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        self.built = True
+
+    def get(self, aid):
+        if not aid:
+            return None
+        with self.lock:
+            if not self.built:
+                self._build()
+            aid = str(aid)
+            path = self.by_id.get(aid)
+            if path is None and len(aid) != AWEME_ID_LEN:
+                path = next((p for run, p in self.runs if aid in run), None)
+            return path
+
+    def add(self, aid, path):
+        if not aid:
+            return
+        with self.lock:
+            self.by_id[str(aid)] = path
+
+def file_id_index(session, save_dir):
+    # 每次运行、每个保存目录只建一次索引，批量采集时多个主页共用
+    key = os.path.abspath(save_dir)
+    with session['lock']:
+        index = session['id_index'].get(key)
+        if index is None:
+            index = session['id_index'][key] = FileIdIndex(key)
+    return index
 
 def extract_author_id(items, url_or_id):
     aid = ''
@@ -376,7 +1026,7 @@ def ensure_project_chromium():
         except Exception:
             pass
 
-def download_requests_job(job, headers, retry, stats, lock, history_path):
+def download_requests_job(job, headers, retry, stats, lock, history, limiter=None):
     ok = False
     for i in range(retry + 1):
         try:
@@ -388,6 +1038,8 @@ def download_requests_job(job, headers, retry, stats, lock, history_path):
                                 f.write(chunk)
                                 with lock:
                                     stats['bytes'] += len(chunk)
+                                if limiter:
+                                    limiter.consume(len(chunk))
                     ok = True
                     break
         except Exception:
@@ -403,107 +1055,186 @@ def download_requests_job(job, headers, retry, stats, lock, history_path):
             size = os.path.getsize(job['path']) if os.path.exists(job['path']) else 0
         except Exception:
             size = 0
-        append_history(history_path, {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'url': job['url'],
-            'path': job['path'],
-            'name': job['name'],
-            'id': job.get('id',''),
-            'title': job.get('title',''),
-            'author': job.get('author',''),
-            'author_handle': job.get('author_handle',''),
-            'publish_time': job.get('publish_time',''),
-            'page_url': job.get('page_url',''),
-            'mode': 'requests',
-            'bytes': str(size),
-            'status': 'success',
-            'key': job.get('key','')
-        })
+        history.append(history_row(job, 'requests', size, 'success'))
     return ok
 
-def run_downloader(url_or_id, save_dir, name_format, threads, retry, mode='requests', aria2_host='127.0.0.1', aria2_port=6800, aria2_secret='', cookie_path=os.path.join('douyin_function', 'config', 'cookie.json'), host_index=1, persist=True, debug_port=9223, login_wait_ms=60000, export_only=False, scroll_idle_max=10, scroll_interval_ms=2000, archive_by_author_id=False, archive_by_handle=False, date_limit='', aria2_max_conn=16, aria2_split=16, aria2_min_split_size='1M', show_browser=True):
-    os.makedirs(save_dir, exist_ok=True)
-    cookie_header, cookies = parse_cookie_file(cookie_path)
-    ensure_project_chromium()
-    def parse_date_limit(val):
-        s = (val or '').strip()
-        if s == '':
-            return {'threshold_ts': None, 'last_day': False, 'stop_on_older': False, 'stop': False}
-        if s == '0':
-            th = int(time.time()) - 86400
-            return {'threshold_ts': th, 'last_day': True, 'stop_on_older': True, 'stop': False}
-        if len(s) == 8 and s.isdigit():
-            y = int(s[0:4]); m = int(s[4:6]); d = int(s[6:8])
-            dt_utc = datetime(y, m, d) - timedelta(hours=8)
-            th = calendar.timegm(dt_utc.timetuple())
-            return {'threshold_ts': th, 'last_day': False, 'stop_on_older': True, 'stop': False}
-        m = _re.match(r"^(\d+)\s*([dDwWmMyY]|Y)$", s)
-        if m:
-            n = int(m.group(1))
-            u = m.group(2).lower()
-            bjt_now = datetime.utcnow() + timedelta(hours=8)
-            def bjt_to_epoch(dt_bjt):
-                return calendar.timegm((dt_bjt - timedelta(hours=8)).timetuple())
-            def sub_months(dt_bjt, months):
-                y = dt_bjt.year
-                mth = dt_bjt.month - months
-                while mth <= 0:
-                    y -= 1
-                    mth += 12
-                last_day = calendar.monthrange(y, mth)[1]
-                day = min(dt_bjt.day, last_day)
-                return datetime(y, mth, day, dt_bjt.hour, dt_bjt.minute, dt_bjt.second)
-            def sub_years(dt_bjt, years):
-                y = dt_bjt.year - years
-                mth = dt_bjt.month
-                last_day = calendar.monthrange(y, mth)[1]
-                day = min(dt_bjt.day, last_day)
-                return datetime(y, mth, day, dt_bjt.hour, dt_bjt.minute, dt_bjt.second)
-            if u == 'd':
-                dt_bjt = bjt_now - timedelta(days=n)
-            elif u == 'w':
-                dt_bjt = bjt_now - timedelta(days=7*n)
-            elif u == 'm':
-                dt_bjt = sub_months(bjt_now, n)
-            else:  # 'y' or 'Y'
-                dt_bjt = sub_years(bjt_now, n)
-            th = bjt_to_epoch(dt_bjt)
-            return {'threshold_ts': th, 'last_day': False, 'stop_on_older': True, 'stop': False}
+def parse_date_limit(val):
+    s = (val or '').strip()
+    if s == '':
         return {'threshold_ts': None, 'last_day': False, 'stop_on_older': False, 'stop': False}
-    control = parse_date_limit(date_limit)
-    with sync_playwright() as p:
-        user_data_dir = os.path.join('douyin_function', 'cache', 'playwright_profile')
-        os.makedirs(user_data_dir, exist_ok=True)
-        args_list = []
-        if debug_port and int(debug_port) > 0:
-            args_list.append(f"--remote-debugging-port={int(debug_port)}")
-        headless = not bool(show_browser)
-        if persist:
-            context = p.chromium.launch_persistent_context(user_data_dir, headless=headless, user_agent=UA, args=args_list or None)
-        else:
-            browser = p.chromium.launch(headless=headless, args=args_list or None)
-            context = browser.new_context(user_agent=UA, extra_http_headers={'Cookie': cookie_header} if cookie_header else None)
-        if cookies:
-            try:
-                context.add_cookies(cookies)
-            except Exception:
-                pass
-        page = context.new_page()
-        items = collect_items(page, host_index=host_index, control=control)
-        if url_or_id.startswith('http'):
-            url = url_or_id
-        else:
-            url = f'https://www.douyin.com/user/{url_or_id}'
-        page.goto(url, wait_until='domcontentloaded')
-        if login_wait_ms and int(login_wait_ms) > 0:
-            page.wait_for_timeout(int(login_wait_ms))
-        autoscroll(page, items, max_idle=int(scroll_idle_max), interval_ms=int(scroll_interval_ms), control=control)
-        time.sleep(3)
-        dom_handle = extract_author_handle_from_dom(page)
-        if dom_handle:
-            for it in items:
-                if not it.get('author_handle'):
-                    it['author_handle'] = dom_handle
+    if s == '0':
+        th = int(time.time()) - 86400
+        return {'threshold_ts': th, 'last_day': True, 'stop_on_older': True, 'stop': False}
+    if len(s) == 8 and s.isdigit():
+        y = int(s[0:4]); m = int(s[4:6]); d = int(s[6:8])
+        dt_utc = datetime(y, m, d) - timedelta(hours=8)
+        th = calendar.timegm(dt_utc.timetuple())
+        return {'threshold_ts': th, 'last_day': False, 'stop_on_older': True, 'stop': False}
+    m = _re.match(r"^(\d+)\s*([dDwWmMyY]|Y)$", s)
+    if m:
+        n = int(m.group(1))
+        u = m.group(2).lower()
+        bjt_now = datetime.utcnow() + timedelta(hours=8)
+        def bjt_to_epoch(dt_bjt):
+            return calendar.timegm((dt_bjt - timedelta(hours=8)).timetuple())
+        def sub_months(dt_bjt, months):
+            y = dt_bjt.year
+            mth = dt_bjt.month - months
+            while mth <= 0:
+                y -= 1
+                mth += 12
+            last_day = calendar.monthrange(y, mth)[1]
+            day = min(dt_bjt.day, last_day)
+            return datetime(y, mth, day, dt_bjt.hour, dt_bjt.minute, dt_bjt.second)
+        def sub_years(dt_bjt, years):
+            y = dt_bjt.year - years
+            mth = dt_bjt.month
+            last_day = calendar.monthrange(y, mth)[1]
+            day = min(dt_bjt.day, last_day)
+            return datetime(y, mth, day, dt_bjt.hour, dt_bjt.minute, dt_bjt.second)
+        if u == 'd':
+            dt_bjt = bjt_now - timedelta(days=n)
+        elif u == 'w':
+            dt_bjt = bjt_now - timedelta(days=7*n)
+        elif u == 'm':
+            dt_bjt = sub_months(bjt_now, n)
+        else:  # 'y' or 'Y'
+            dt_bjt = sub_years(bjt_now, n)
+        th = bjt_to_epoch(dt_bjt)
+        return {'threshold_ts': th, 'last_day': False, 'stop_on_older': True, 'stop': False}
+    return {'threshold_ts': None, 'last_day': False, 'stop_on_older': False, 'stop': False}
+
+def build_headers(cookie_header):
+    headers = {
+        'User-Agent': UA,
+        'Range': 'bytes=0-',
+        'Referer': 'https://www.douyin.com/',
+    }
+    if cookie_header:
+        headers['Cookie'] = cookie_header
+    return headers
+
+def parse_rate(val):
+    # 限速参数：纯数字为字节/秒，支持 K/M/G 后缀；0 或空表示不限速
+    s = str(val or '').strip().upper()
+    if not s:
+        return 0
+    mul = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}.get(s[-1], 1)
+    try:
+        return int(float(s[:-1] if mul > 1 else s) * mul)
+    except ValueError:
+        return 0
+
+def open_context(p, persist=True, show_browser=True, lean=False, debug_port=9223, cookie_header='', cookies=None):
+    user_data_dir = os.path.join('douyin_function', 'cache', 'playwright_profile')
+    os.makedirs(user_data_dir, exist_ok=True)
+    args_list = []
+    if debug_port and int(debug_port) > 0:
+        args_list.append(f"--remote-debugging-port={int(debug_port)}")
+    headless = not bool(show_browser)
+    viewport = None
+    if lean:
+        # 精简采集：无界面、小窗口、禁止自动播放，并拦截图片/媒体/字体/统计请求
+        headless = True
+        viewport = LEAN_VIEWPORT
+        args_list.extend(LEAN_ARGS)
+    browser = None
+    if persist:
+        context = p.chromium.launch_persistent_context(user_data_dir, headless=headless, user_agent=UA, args=args_list or None, viewport=viewport)
+    else:
+        browser = p.chromium.launch(headless=headless, args=args_list or None)
+        context = browser.new_context(user_agent=UA, extra_http_headers={'Cookie': cookie_header} if cookie_header else None, viewport=viewport)
+    if lean:
+        apply_harvest_profile(context)
+    if cookies:
+        try:
+            context.add_cookies(cookies)
+        except Exception:
+            pass
+    return context, browser
+
+def monitor_progress(stats, stop_event):
+    last_bytes = 0
+    last_t = time.time()
+    while not stop_event.is_set():
+        now = time.time()
+        delta_b = max(0, stats['bytes'] - last_bytes)
+        delta_t = max(1e-6, now - last_t)
+        speed = delta_b / delta_t
+        print(f"进度: 已完成 {stats['completed']}/{stats['queued']}, 跳过 {stats['skipped']}, 失败 {stats['failed']}, 已下载 {human_bytes(stats['bytes'])} 速度 {human_bytes(speed)}/s")
+        last_bytes = stats['bytes']
+        last_t = now
+        time.sleep(1)
+
+def start_session(mode, threads, retry, headers, export_only=False, aria2=None, rate_limit=0):
+    # 一次运行共享的下载资源：历史记录、统计、下载管道（全局限速）与进度输出；批量采集时所有主页共用
+    store = open_history_store()
+    session = {
+        'mode': mode,
+        'store': store,
+        'history': HistoryWriter(store),
+        'stats': {'completed': 0, 'failed': 0, 'bytes': 0, 'queued': 0, 'skipped': 0},
+        'lock': threading.Lock(),
+        'export_jobs': [],
+        'id_index': {},
+        'pipeline': None,
+        'stop_event': threading.Event(),
+        'monitor': None,
+    }
+    if export_only:
+        return session
+    rate = parse_rate(rate_limit)
+    session['pipeline'] = DownloadPipeline(mode, threads, retry, headers, session['stats'], session['lock'], session['history'],
+                                           queue_size=max(1, int(threads)) * 25, aria2=aria2, limiter=RateLimiter(rate))
+    if session['pipeline'].client is not None and rate > 0:
+        session['pipeline'].client.change_global_option({'max-overall-download-limit': str(rate)})
+    session['monitor'] = threading.Thread(target=monitor_progress, args=(session['stats'], session['stop_event']), daemon=True)
+    session['monitor'].start()
+    return session
+
+def finish_session(session):
+    stats = session['stats']
+    if stats['skipped']:
+        print(f"跳过已下载且文件存在的 {stats['skipped']} 个任务")
+    if session['pipeline'] is None:
+        session['history'].close()
+        session['store'].close()
+        export_path = os.path.join('douyin_function', 'config', 'export_urls.txt')
+        os.makedirs(os.path.dirname(export_path), exist_ok=True)
+        with open(export_path, 'w', encoding='utf-8') as f:
+            for j in session['export_jobs']:
+                f.write(f"{j['url']}\t{j['path']}\t{j['name']}\t{j.get('id','')}\t{j.get('author','')}\t{j.get('title','')}\n")
+        return session['export_jobs']
+    print(f"采集结束，共{stats['queued']}个可下载资源，等待下载完成")
+    results = session['pipeline'].close()
+    session['stop_event'].set()
+    try:
+        session['monitor'].join(timeout=2)
+    except Exception:
+        pass
+    session['history'].close()
+    session['store'].close()
+    return results
+
+def harvest_target(context, url_or_id, save_dir, name_format, control, session, host_index=1, login_wait_ms=0, harvest_mode='scroll', scroll_idle_max=10, scroll_interval_ms=2000, archive_by_author_id=False, archive_by_handle=False):
+    # 采集单个主页：新开页面，边采集边把任务交给会话的下载管道（仅导出时收集到 export_jobs）
+    stats = session['stats']
+    lock = session['lock']
+    history = session['history']
+    pipeline = session['pipeline']
+    page = context.new_page()
+    items = collect_items(page, host_index=host_index, control=control)
+    if url_or_id.startswith('http'):
+        url = url_or_id
+    else:
+        url = f'https://www.douyin.com/user/{url_or_id}'
+    page.goto(url, wait_until='domcontentloaded')
+    if login_wait_ms and int(login_wait_ms) > 0:
+        page.wait_for_timeout(int(login_wait_ms))
+    # 采集到的作品边滚动边生成任务：归档目录在第一批作品到达时确定，之后保持不变
+    state = {'consumed': 0, 'index': 0, 'save_dir': None, 'dom_handle': ''}
+    def resolve_save_dir():
+        dom_handle = state['dom_handle'] = extract_author_handle_from_dom(page)
         subdir = None
         if archive_by_handle:
             h = dom_handle if dom_handle else (url_or_id if (url_or_id and not url_or_id.startswith('http')) else '')
@@ -517,156 +1248,76 @@ def run_downloader(url_or_id, save_dir, name_format, threads, retry, mode='reque
                 aid = extract_author_id(items, url)
                 if aid:
                     subdir = aid
-        if subdir:
-            save_dir = os.path.join(save_dir, subdir)
-            os.makedirs(save_dir, exist_ok=True)
-        cookie_used = cookie_header
-        headers = {
-            'User-Agent': UA,
-            'Range': 'bytes=0-',
-            'Referer': 'https://www.douyin.com/',
-        }
-        if cookie_used:
-            headers['Cookie'] = cookie_used
-        jobs = build_jobs(items, save_dir, name_format)
-        history_path = os.path.join('douyin_function', 'config', 'histroy.csv')
-        history_map_key, history_map_url = read_history_map(history_path)
-        new_jobs = []
-        skipped = 0
+        target = os.path.join(save_dir, subdir) if subdir else save_dir
+        os.makedirs(target, exist_ok=True)
+        return target
+    def feed():
+        new_items = items.since(state['consumed'])
+        if not new_items:
+            return
+        if state['save_dir'] is None:
+            state['save_dir'] = resolve_save_dir()
+        state['consumed'] += len(new_items)
+        if state['dom_handle']:
+            for it in new_items:
+                if not it.get('author_handle'):
+                    it['author_handle'] = state['dom_handle']
+        id_index = file_id_index(session, state['save_dir'])
+        jobs = build_jobs(new_items, state['save_dir'], name_format, start_index=state['index'])
+        state['index'] += len(jobs)
         for j in jobs:
-            rec_path = history_map_key.get(j.get('key')) or history_map_url.get(j['url'])
-            if not rec_path and j.get('type') == 'video':
-                rec_path = find_existing_by_id(save_dir, j.get('id'))
+            rec_path = session['store'].lookup(key=j.get('key'), url=j['url'], aweme_id=j.get('id') if j.get('type') == 'video' else None)
+            recorded = bool(rec_path) and os.path.exists(rec_path)
+            rec_exists = recorded
+            if not rec_exists and j.get('type') == 'video':
+                rec_path = id_index.get(j.get('id'))
+                rec_exists = bool(rec_path) and os.path.exists(rec_path)
             path_exists = os.path.exists(j['path'])
-            if (rec_path and os.path.exists(rec_path)) or path_exists:
-                skipped += 1
-                append_history(history_path, {
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'url': j.get('url',''),
-                    'path': rec_path if rec_path and os.path.exists(rec_path) else (j['path'] if path_exists else ''),
-                    'name': j.get('name',''),
-                    'id': j.get('id',''),
-                    'title': j.get('title',''),
-                    'author': j.get('author',''),
-                    'page_url': j.get('page_url',''),
-                    'mode': mode,
-                    'bytes': str(os.path.getsize(rec_path) if rec_path and os.path.exists(rec_path) else (os.path.getsize(j['path']) if path_exists else 0)),
-                    'status': 'skipped',
-                    'key': j.get('key','')
-                })
+            if rec_exists or path_exists:
+                with lock:
+                    stats['skipped'] += 1
+                # 历史中已有且文件仍在的不再写记录；只有磁盘上找到、历史中没有的才补记
+                if not recorded:
+                    skip_path = rec_path if rec_exists else j['path']
+                    history.append(history_row(j, session['mode'], os.path.getsize(skip_path), 'skipped', path=skip_path))
                 continue
-            new_jobs.append(j)
-        jobs = new_jobs
-        if skipped:
-            print(f"跳过已下载且文件存在的 {skipped} 个任务")
-        if export_only:
-            export_path = os.path.join('douyin_function', 'config', 'export_urls.txt')
-            os.makedirs(os.path.dirname(export_path), exist_ok=True)
-            with open(export_path, 'w', encoding='utf-8') as f:
-                for j in jobs:
-                    f.write(f"{j['url']}\t{j['path']}\t{j['name']}\t{j.get('id','')}\t{j.get('author','')}\t{j.get('title','')}\n")
-            return jobs
-        print(f"发现{len(jobs)}个可下载资源")
-        for i, j in enumerate(jobs, 1):
-            print(f"[{i}] {j['url']} -> {j['path']}")
-        stats = {'completed': 0, 'failed': 0, 'bytes': 0}
-        lock = threading.Lock()
-        stop_event = threading.Event()
-        def monitor():
-            total = len(jobs)
-            last_bytes = 0
-            last_t = time.time()
-            while not stop_event.is_set():
-                now = time.time()
-                delta_b = max(0, stats['bytes'] - last_bytes)
-                delta_t = max(1e-6, now - last_t)
-                speed = delta_b / delta_t
-                print(f"进度: 已完成 {stats['completed']}/{total}, 跳过 {skipped}, 失败 {stats['failed']}, 已下载 {human_bytes(stats['bytes'])} 速度 {human_bytes(speed)}/s")
-                last_bytes = stats['bytes']
-                last_t = now
-                time.sleep(1)
-        mon = threading.Thread(target=monitor, daemon=True)
-        mon.start()
-        results = []
-        if mode == 'aria2c':
-            gid_to_job = {}
-            for j in jobs:
-                gid = download_aria2(j['url'], j['name'], save_dir, headers, host=aria2_host, port=aria2_port, secret=aria2_secret, max_conn=aria2_max_conn, split=aria2_split, min_split_size=aria2_min_split_size)
-                if not gid:
-                    ok = download_requests_job(j, headers, retry, stats, lock, history_path)
-                    results.append(ok)
-                else:
-                    gid_to_job[gid] = j
-            gid_bytes = {gid: 0 for gid in gid_to_job.keys()}
-            alive = set(gid_to_job.keys())
-            rpc = f'http://{aria2_host}:{aria2_port}/jsonrpc'
-            def tell_status(gid):
-                params = [[gid]]
-                if aria2_secret:
-                    params.insert(0, f'token:{aria2_secret}')
-                payload = {'jsonrpc': '2.0', 'id': gid, 'method': 'aria2.tellStatus', 'params': params}
-                try:
-                    r = requests.post(rpc, json=payload, timeout=5)
-                    if r.status_code == 200:
-                        return r.json().get('result')
-                except Exception:
-                    return None
-                return None
-            while alive:
-                time.sleep(1)
-                for gid in list(alive):
-                    st = tell_status(gid)
-                    if not st:
-                        continue
-                    try:
-                        cl = int(st.get('completedLength', '0'))
-                        with lock:
-                            delta = max(0, cl - gid_bytes.get(gid, 0))
-                            stats['bytes'] += delta
-                            gid_bytes[gid] = cl
-                        status = st.get('status')
-                        if status in ['complete', 'error', 'removed']:
-                            alive.discard(gid)
-                            with lock:
-                                if status == 'complete':
-                                    stats['completed'] += 1
-                                    results.append(True)
-                                    j = gid_to_job.get(gid, {})
-                                    size = cl
-                                    append_history(history_path, {
-                                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                        'url': j.get('url',''),
-                                        'path': j.get('path',''),
-                                        'name': j.get('name',''),
-                                        'id': j.get('id',''),
-                                        'title': j.get('title',''),
-                                        'author': j.get('author',''),
-                                        'author_handle': j.get('author_handle',''),
-                                        'publish_time': j.get('publish_time',''),
-                                        'page_url': j.get('page_url',''),
-                                        'mode': 'aria2c',
-                                        'bytes': str(size),
-                                        'status': 'success',
-                                        'key': j.get('key','')
-                                    })
-                                else:
-                                    stats['failed'] += 1
-                                    results.append(False)
-                    except Exception:
-                        pass
-        else:
-            with ThreadPoolExecutor(max_workers=max(1, int(threads))) as ex:
-                futs = {ex.submit(download_requests_job, j, headers, retry, stats, lock, history_path): j for j in jobs}
-                for f in as_completed(futs):
-                    try:
-                        results.append(bool(f.result()))
-                    except Exception:
-                        results.append(False)
-        stop_event.set()
-        try:
-            mon.join(timeout=2)
-        except Exception:
-            pass
+            if pipeline is None:
+                with lock:
+                    session['export_jobs'].append(j)
+                continue
+            if j.get('type') == 'video':
+                id_index.add(j.get('id'), j['path'])
+            print(f"[{stats['queued'] + 1}] {j['url']} -> {j['path']}")
+            pipeline.put(j)
+    feed()
+    harvested = False
+    if harvest_mode == 'api':
+        harvested = harvest_api(page, control, on_progress=feed)
+        if not harvested:
+            print("直接翻页不可用，改用滚动采集")
+    if not harvested:
+        autoscroll(page, items, max_idle=int(scroll_idle_max), interval_ms=int(scroll_interval_ms), control=control, on_progress=feed)
+    # 等待最后一批响应到达并解析完成后再收尾
+    page.wait_for_timeout(3000)
+    items.drain()
+    feed()
+    try:
+        page.close()
+    except Exception:
+        pass
+    return items
+
+def run_downloader(url_or_id, save_dir, name_format, threads, retry, mode='requests', aria2_host='127.0.0.1', aria2_port=6800, aria2_secret='', cookie_path=os.path.join('douyin_function', 'config', 'cookie.json'), host_index=1, persist=True, debug_port=9223, login_wait_ms=60000, export_only=False, scroll_idle_max=10, scroll_interval_ms=2000, archive_by_author_id=False, archive_by_handle=False, date_limit='', aria2_max_conn=16, aria2_split=16, aria2_min_split_size='1M', show_browser=True, harvest_mode='scroll', lean=False, rate_limit=0):
+    os.makedirs(save_dir, exist_ok=True)
+    cookie_header, cookies = parse_cookie_file(cookie_path)
+    ensure_project_chromium()
+    control = parse_date_limit(date_limit)
+    aria2 = {'host': aria2_host, 'port': aria2_port, 'secret': aria2_secret, 'max_conn': aria2_max_conn, 'split': aria2_split, 'min_split_size': aria2_min_split_size}
+    with sync_playwright() as p:
+        context, browser = open_context(p, persist=persist, show_browser=show_browser, lean=lean, debug_port=debug_port, cookie_header=cookie_header, cookies=cookies)
+        session = start_session(mode, threads, retry, build_headers(cookie_header), export_only=export_only, aria2=aria2, rate_limit=rate_limit)
+        harvest_target(context, url_or_id, save_dir, name_format, control, session, host_index=host_index, login_wait_ms=login_wait_ms, harvest_mode=harvest_mode, scroll_idle_max=scroll_idle_max, scroll_interval_ms=scroll_interval_ms, archive_by_author_id=archive_by_author_id, archive_by_handle=archive_by_handle)
+        results = finish_session(session)
         context.close()
         try:
             browser.close()
@@ -674,6 +1325,70 @@ def run_downloader(url_or_id, save_dir, name_format, threads, retry, mode='reque
             pass
         return results
 
+def export_storage_state(show_browser=False, lean=False):
+    # 从持久化配置导出一次登录态（Cookie/localStorage），批量采集的各个上下文共用，避免争用同一个配置目录
+    state_path = os.path.join('douyin_function', 'cache', 'storage_state.json')
+    user_data_dir = os.path.join('douyin_function', 'cache', 'playwright_profile')
+    if not os.path.isdir(user_data_dir):
+        return None
+    try:
+        with sync_playwright() as p:
+            context = p.chromium.launch_persistent_context(user_data_dir, headless=lean or not bool(show_browser), user_agent=UA)
+            context.storage_state(path=state_path)
+            context.close()
+        return state_path
+    except Exception as e:
+        print(f"导出登录态失败: {e}")
+        return None
+
+def run_batch(targets, save_dir, name_format, threads, retry, mode='requests', aria2_host='127.0.0.1', aria2_port=6800, aria2_secret='', cookie_path=os.path.join('douyin_function', 'config', 'cookie.json'), host_index=1, persist=True, login_wait_ms=0, export_only=False, scroll_idle_max=10, scroll_interval_ms=2000, archive_by_author_id=True, archive_by_handle=False, date_limit='', aria2_max_conn=16, aria2_split=16, aria2_min_split_size='1M', show_browser=False, harvest_mode='scroll', lean=False, rate_limit=0, contexts=2):
+    # 批量采集：contexts 个工作线程各自启动一个浏览器，依次为每个主页新建上下文（共享导出的登录态）；
+    # 所有主页的任务进入同一个下载管道，由 threads 和 rate_limit 统一控制并发与总速度
+    targets = [t.strip() for t in targets if t and t.strip()]
+    if not targets:
+        return []
+    os.makedirs(save_dir, exist_ok=True)
+    cookie_header, cookies = parse_cookie_file(cookie_path)
+    ensure_project_chromium()
+    state_path = export_storage_state(show_browser=show_browser, lean=lean) if persist else None
+    aria2 = {'host': aria2_host, 'port': aria2_port, 'secret': aria2_secret, 'max_conn': aria2_max_conn, 'split': aria2_split, 'min_split_size': aria2_min_split_size}
+    session = start_session(mode, threads, retry, build_headers(cookie_header), export_only=export_only, aria2=aria2, rate_limit=rate_limit)
+    pending = queue.Queue()
+    for t in targets:
+        pending.put(t)
+    def worker():
+        with sync_playwright() as p:
+            headless = lean or not bool(show_browser)
+            browser = p.chromium.launch(headless=headless, args=LEAN_ARGS if lean else None)
+            while True:
+                try:
+                    target = pending.get_nowait()
+                except queue.Empty:
+                    break
+                context = browser.new_context(user_agent=UA, storage_state=state_path, viewport=LEAN_VIEWPORT if lean else None,
+                                              extra_http_headers={'Cookie': cookie_header} if (cookie_header and not state_path) else None)
+                if lean:
+                    apply_harvest_profile(context)
+                if cookies:
+                    try:
+                        context.add_cookies(cookies)
+                    except Exception:
+                        pass
+                print(f"开始采集: {target}")
+                try:
+                    harvest_target(context, target, save_dir, name_format, parse_date_limit(date_limit), session, host_index=host_index, login_wait_ms=login_wait_ms, harvest_mode=harvest_mode, scroll_idle_max=scroll_idle_max, scroll_interval_ms=scroll_interval_ms, archive_by_author_id=archive_by_author_id, archive_by_handle=archive_by_handle)
+                except Exception as e:
+                    print(f"采集失败 {target}: {e}")
+                finally:
+                    context.close()
+            browser.close()
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, min(int(contexts), len(targets))))]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return finish_session(session)
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
@@ -703,13 +1418,25 @@ def main():
     # --export_only: 仅导出直链与保存路径，不下载（1/0）；
     #                导出路径 douyin_function/config/export_urls.txt。
     # --scroll_idle_max: 滚动采集的最大空闲轮数（默认10）；
-    #                    资源数不再增长时累计空闲计数，达到上限结束采集。
-    # --scroll_interval_ms: 每次滚动的间隔毫秒（默认2000）；
-    #                       数值越小滚动越频繁，可能更快采集。
+    #                    滚动后等不到新的列表响应时累计空闲计数，达到上限结束采集；
+    #                    响应中 has_more 为假时直接结束。
+    # --scroll_interval_ms: 每次滚动后等待列表响应的最长毫秒（默认2000）；
+    #                       响应到达后立即继续滚动。
     # --archive_by_author_id: 是否按作者唯一ID归档到子目录（1/0）；
     #                         使用 sec_uid/输入 ID 作为子目录名。
     # --archive_by_handle: 是否按作者抖音号归档到子目录（1/0）；
     #                      优先从页面 DOM 提取“抖音号：”文本，其次响应。
+    # --lean: 精简采集（1/0）；无界面运行、800x600 窗口、禁止自动播放，
+    #         通过 context.route 拦截图片、视频、字体与统计上报，降低 CPU/内存/带宽占用。
+    # --harvest_mode: 采集方式；scroll 为滚动页面触发加载；
+    #                 api 为捕获首个作品列表请求后在页面内按 max_cursor 直接翻页，失败时自动改用滚动。
+    # --batch_file: 批量采集的目标列表文件，每行一个主页链接或作者ID（# 开头为注释）；
+    #               指定后忽略 --url_or_id，所有主页共用同一个下载管道与历史记录。
+    # --contexts: 批量采集时的并行浏览器数；每个浏览器按主页依次新建上下文，共享导出的登录态。
+    # --import_history: 把已有的历史 CSV（逗号分隔多个）导入 douyin_function/config/history.db 后退出；
+    #                   默认位置的 histroy.csv 会在首次运行时自动导入一次。
+    # --rate_limit: 全局下载限速（字节/秒，支持 K/M/G 后缀，0=不限速）；
+    #               requests 模式由所有下载线程共用的令牌桶控制，aria2c 模式设置 max-overall-download-limit。
     parser.add_argument('--url_or_id', default='https://www.douyin.com/user/MS4wLjABAAAALK15ylKOfoJpXG8Z61u5nxxDkqS5eznbA_8wWZgPPfU?from_tab_name=main&relation=1&vid=7575851370537245625', help='抖音主页链接或作者唯一ID/抖音号')
     parser.add_argument('--save_dir', default=os.path.join(os.getcwd(), 'downloads/douyin_test'), help='保存根目录')
     parser.add_argument('--name_format', default='【{发布者}/{抖音号}】{时间}_{i}_{标题}({id})', help='文件命名模板，支持 {发布者} {标题} {id} {i} {抖音号} {时间}')
@@ -727,13 +1454,30 @@ def main():
     parser.add_argument('--login_wait_ms', type=int, default=5000, help='登录等待时间（毫秒）')
     parser.add_argument('--export_only', type=int, default=0, help='仅导出直链不下载')
     parser.add_argument('--scroll_idle_max', type=int, default=10, help='滚动采集最大空闲轮数')
-    parser.add_argument('--scroll_interval_ms', type=int, default=2000, help='滚动间隔毫秒')
+    parser.add_argument('--scroll_interval_ms', type=int, default=2000, help='滚动后等待列表响应的最长毫秒')
     parser.add_argument('--archive_by_author_id', type=int, default=1, help='按作者唯一ID归档到子目录')
     parser.add_argument('--archive_by_handle', type=int, default=0, help='按作者抖音号归档到子目录')
     parser.add_argument('--date_limit', default='', help='日期控制：空=全部；0=最近一天；YYYYMMDD=提取到该日期为止；扩展：Nd/Nw/Nm/NY 表示最近N天/周/月/年')
     parser.add_argument('--show_browser', type=int, default=1, help='是否显示浏览器窗口')
+    parser.add_argument('--lean', type=int, default=0, help='精简采集：无界面、小窗口、禁止自动播放并拦截图片/媒体/字体/统计请求')
+    parser.add_argument('--harvest_mode', choices=['scroll', 'api'], default='scroll', help='采集方式：scroll=滚动页面；api=捕获首个作品列表请求后在页面内直接翻页')
+    parser.add_argument('--batch_file', default='', help='批量采集目标列表文件，每行一个主页链接或作者ID')
+    parser.add_argument('--contexts', type=int, default=2, help='批量采集并行浏览器数')
+    parser.add_argument('--rate_limit', default='0', help='全局下载限速（字节/秒，支持 K/M/G 后缀，0=不限速）')
+    parser.add_argument('--import_history', default='', help='导入历史 CSV 到 SQLite 后退出（逗号分隔多个文件）')
     args = parser.parse_args()
-    run_downloader(args.url_or_id, args.save_dir, args.name_format, args.threads, args.retry, mode=args.mode, aria2_host=args.aria2_host, aria2_port=args.aria2_port, aria2_secret=args.aria2_secret, persist=bool(args.persist), debug_port=args.debug_port, login_wait_ms=args.login_wait_ms, export_only=bool(args.export_only), scroll_idle_max=args.scroll_idle_max, scroll_interval_ms=args.scroll_interval_ms, archive_by_author_id=bool(args.archive_by_author_id), archive_by_handle=bool(args.archive_by_handle), date_limit=args.date_limit, aria2_max_conn=args.aria2_max_conn, aria2_split=args.aria2_split, aria2_min_split_size=args.aria2_min_split_size, show_browser=bool(args.show_browser))
+    if args.import_history:
+        store = HistoryStore()
+        for path in [x.strip() for x in args.import_history.split(',') if x.strip()]:
+            store.import_csv(path)
+        store.close()
+        return
+    if args.batch_file:
+        with open(args.batch_file, 'r', encoding='utf-8') as f:
+            targets = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+        run_batch(targets, args.save_dir, args.name_format, args.threads, args.retry, mode=args.mode, aria2_host=args.aria2_host, aria2_port=args.aria2_port, aria2_secret=args.aria2_secret, persist=bool(args.persist), login_wait_ms=0, export_only=bool(args.export_only), scroll_idle_max=args.scroll_idle_max, scroll_interval_ms=args.scroll_interval_ms, archive_by_author_id=bool(args.archive_by_author_id), archive_by_handle=bool(args.archive_by_handle), date_limit=args.date_limit, aria2_max_conn=args.aria2_max_conn, aria2_split=args.aria2_split, aria2_min_split_size=args.aria2_min_split_size, show_browser=bool(args.show_browser), harvest_mode=args.harvest_mode, lean=bool(args.lean), rate_limit=args.rate_limit, contexts=args.contexts)
+        return
+    run_downloader(args.url_or_id, args.save_dir, args.name_format, args.threads, args.retry, mode=args.mode, aria2_host=args.aria2_host, aria2_port=args.aria2_port, aria2_secret=args.aria2_secret, persist=bool(args.persist), debug_port=args.debug_port, login_wait_ms=args.login_wait_ms, export_only=bool(args.export_only), scroll_idle_max=args.scroll_idle_max, scroll_interval_ms=args.scroll_interval_ms, archive_by_author_id=bool(args.archive_by_author_id), archive_by_handle=bool(args.archive_by_handle), date_limit=args.date_limit, aria2_max_conn=args.aria2_max_conn, aria2_split=args.aria2_split, aria2_min_split_size=args.aria2_min_split_size, show_browser=bool(args.show_browser), harvest_mode=args.harvest_mode, lean=bool(args.lean), rate_limit=args.rate_limit)
 
 if __name__ == '__main__':
     main()
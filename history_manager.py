@@ -8,10 +8,251 @@
 import sqlite3
 import os
 import time
+import queue
+import atexit
+import threading
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
+
+class HistoryWriteBehind:
+    """历史记录后写队列
+    
+    后台线程收集插入/更新操作，每隔 flush_interval_ms 毫秒或累计 max_batch 条
+    操作时合并为一个事务提交。每个批次要么整体落盘要么整体回滚，配合 WAL 模式
+    与 synchronous=NORMAL，既不会因崩溃损坏数据库，也不必为每条记录等待 fsync。
+    进程退出时通过 atexit 自动刷新未提交的操作。
+    """
+    
+    _INSERT_COLUMNS = ('url', 'title', 'file_path', 'file_name', 'thumbnail_path',
+                       'file_size', 'status', 'platform', 'duration',
+                       'download_time', 'updated_at')
+    
+    def __init__(self, db_path: str, flush_interval_ms: int = 200, max_batch: int = 500):
+        """初始化后写队列
+        
+        Args:
+            db_path: 数据库文件路径
+            flush_interval_ms: 批次最长等待时间（毫秒）
+            max_batch: 单个事务最多包含的操作数
+        """
+        self.db_path = db_path
+        self.flush_interval = max(0.001, flush_interval_ms / 1000.0)
+        self.max_batch = max(1, int(max_batch))
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="HistoryWriteBehind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def submit_insert(self, values: Dict, force_create: bool = False):
+        """提交插入操作
+        
+        Args:
+            values: 字段值字典
+            force_create: 是否忽略URL重复检查
+        """
+        self._queue.put(('insert', values, force_create))
+    
+    def submit_update(self, record_id: int, fields: Dict):
+        """提交更新操作
+        
+        Args:
+            record_id: 记录ID
+            fields: 要更新的字段
+        """
+        if fields:
+            self._queue.put(('update', record_id, fields))
+    
+    def has_pending(self) -> bool:
+        """是否还有未提交的操作"""
+        return self._queue.unfinished_tasks > 0
+    
+    def flush(self, timeout: float = None) -> bool:
+        """阻塞直到当前已提交的操作全部写入数据库
+        
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+            
+        Returns:
+            bool: 是否在超时前完成
+        """
+        if self._closed or not self._thread.is_alive():
+            return not self.has_pending()
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+    
+    def close(self, timeout: float = 10.0):
+        """刷新剩余操作并停止后台线程"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+    
+    def _run(self):
+        """后台线程主循环"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while True:
+                op = self._queue.get()
+                if op is None:
+                    self._queue.task_done()
+                    break
+                batch = [op]
+                deadline = time.monotonic() + self.flush_interval
+                # 在时间窗口内尽量多收集操作；遇到flush请求立即提交
+                while len(batch) < self.max_batch and batch[-1][0] != 'flush':
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        nxt = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        self._queue.put(None)
+                        self._queue.task_done()
+                        break
+                    batch.append(nxt)
+                self._write_batch(conn, batch)
+                for _ in batch:
+                    self._queue.task_done()
+        finally:
+            conn.close()
+    
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        """在单个事务中写入一批操作，失败时逐条重试以免整批丢失"""
+        ops = [op for op in batch if op[0] != 'flush']
+        if ops:
+            try:
+                with conn:
+                    for op in ops:
+                        self._apply(conn, op)
+            except sqlite3.Error as e:
+                print(f"批量写入历史记录失败，改为逐条写入: {e}")
+                for op in ops:
+                    try:
+                        with conn:
+                            self._apply(conn, op)
+                    except sqlite3.Error as op_error:
+                        print(f"写入历史记录失败: {op_error}")
+        for op in batch:
+            if op[0] == 'flush':
+                op[1].set()
+    
+    def _apply(self, conn: sqlite3.Connection, op: tuple):
+        """执行单个操作"""
+        if op[0] == 'insert':
+            _, values, force_create = op
+            if not force_create:
+                row = conn.execute(
+                    "SELECT id FROM download_history WHERE url = ? LIMIT 1",
+                    (values.get('url'),)
+                ).fetchone()
+                if row:
+                    return
+            columns = [c for c in self._INSERT_COLUMNS if c in values]
+            conn.execute(f"""
+                INSERT INTO download_history ({", ".join(columns)})
+                VALUES ({", ".join(["?"] * len(columns))})
+            """, [values[c] for c in columns])
+        elif op[0] == 'update':
+            _, record_id, fields = op
+            set_clause = ", ".join([f"{key} = ?" for key in fields.keys()])
+            conn.execute(f"""
+                UPDATE download_history 
+                SET {set_clause}
+                WHERE id = ?
+            """, list(fields.values()) + [record_id])
+
+
+def _latest_refresh_sql(ref: str) -> str:
+    """生成刷新某个去重分组 is_latest 标记的语句（用于触发器）
+    
+    Args:
+        ref: 触发器中的行引用（NEW 或 OLD）
+        
+    Returns:
+        str: UPDATE 语句，仅修改标记发生变化的行
+    """
+    key = f"url = {ref}.url AND COALESCE(file_path, '') = COALESCE({ref}.file_path, '')"
+    latest = f"(id = (SELECT MAX(id) FROM download_history WHERE {key}))"
+    return f"UPDATE download_history SET is_latest = {latest} WHERE {key} AND is_latest IS NOT {latest};"
+
+
+def _stats_delta_sql(ref: str, sign: str) -> str:
+    """生成按单行增减统计计数的语句（用于触发器），只统计 is_latest 行
+    
+    Args:
+        ref: 触发器中的行引用（NEW 或 OLD）
+        sign: '+' 表示计入，'-' 表示移除
+        
+    Returns:
+        str: 更新 history_stats 与 history_platform_stats 的语句
+    """
+    success = f"CASE WHEN {ref}.status = 'success' THEN 1 ELSE 0 END"
+    size = f"CASE WHEN {ref}.status = 'success' THEN COALESCE({ref}.file_size, 0) ELSE 0 END"
+    platform = f"COALESCE({ref}.platform, '')"
+    sql = f"""
+        UPDATE history_stats SET
+            total_count = total_count {sign} 1,
+            success_count = success_count {sign} ({success}),
+            total_size = total_size {sign} ({size})
+        WHERE id = 1 AND {ref}.is_latest = 1;
+    """
+    if sign == '+':
+        sql += f"""
+        INSERT INTO history_platform_stats (platform, count)
+        SELECT {platform}, 1 WHERE {ref}.is_latest = 1
+        ON CONFLICT(platform) DO UPDATE SET count = count + 1;
+        """
+    else:
+        sql += f"""
+        UPDATE history_platform_stats SET count = count - 1
+        WHERE platform = {platform} AND {ref}.is_latest = 1;
+        DELETE FROM history_platform_stats
+        WHERE platform = {platform} AND count <= 0;
+        """
+    return sql
+
+
+# 可排序字段对应的排序表达式；NULL 折叠为默认值，保证游标比较与索引顺序一致
+_SORT_EXPRESSIONS = {
+    'download_time': "download_time",
+    'file_size': "COALESCE(file_size, 0)",
+    'title': "COALESCE(title, '')",
+    'platform': "COALESCE(platform, '')",
+}
+
+
+# 按数据库路径共享后写队列，保证同一数据库的所有管理器实例读到一致的数据
+_write_behind_writers: Dict[str, HistoryWriteBehind] = {}
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind(db_path: str) -> HistoryWriteBehind:
+    """获取（必要时创建）指定数据库的后写队列
+    
+    Args:
+        db_path: 数据库文件路径
+        
+    Returns:
+        HistoryWriteBehind: 共享的后写队列
+    """
+    key = os.path.abspath(db_path)
+    with _write_behind_lock:
+        writer = _write_behind_writers.get(key)
+        if writer is None:
+            writer = HistoryWriteBehind(db_path)
+            _write_behind_writers[key] = writer
+        return writer
+
+
 class HistoryManager:
     """历史记录管理器"""
     
@@ -35,6 +276,9 @@ class HistoryManager:
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
+            # 使用WAL日志模式，后写队列提交时不阻塞界面读取
+            cursor.execute("PRAGMA journal_mode=WAL")
+            
             # 创建历史记录表
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS download_history (
@@ -50,6 +294,7 @@ class HistoryManager:
                     platform TEXT,
                     duration TEXT,
                     error_msg TEXT,
+                    is_latest INTEGER NOT NULL DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
@@ -63,6 +308,103 @@ class HistoryManager:
                 # 字段已存在，忽略错误
                 pass
             
+            # 检查并添加 is_latest 字段：标记每个 (url, file_path) 组合的最新记录
+            try:
+                cursor.execute("ALTER TABLE download_history ADD COLUMN is_latest INTEGER NOT NULL DEFAULT 0")
+                cursor.execute("""
+                    UPDATE download_history SET is_latest = (id IN (
+                        SELECT MAX(id) FROM download_history
+                        GROUP BY url, COALESCE(file_path, '')
+                    ))
+                """)
+                print("已添加 is_latest 字段到数据库并完成回填")
+            except sqlite3.OperationalError:
+                # 字段已存在，忽略错误
+                pass
+            
+            # 触发器维护 is_latest 标记，读取时无需再做 GROUP BY 去重
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_history_latest_insert
+                AFTER INSERT ON download_history
+                BEGIN
+                    {_latest_refresh_sql('NEW')}
+                END
+            """)
+            
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_history_latest_update
+                AFTER UPDATE OF url, file_path ON download_history
+                WHEN OLD.url IS NOT NEW.url
+                  OR COALESCE(OLD.file_path, '') <> COALESCE(NEW.file_path, '')
+                BEGIN
+                    {_latest_refresh_sql('OLD')}
+                    {_latest_refresh_sql('NEW')}
+                END
+            """)
+            
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_history_latest_delete
+                AFTER DELETE ON download_history
+                WHEN OLD.is_latest = 1
+                BEGIN
+                    {_latest_refresh_sql('OLD')}
+                END
+            """)
+            
+            # 统计计数表：只统计 is_latest 行，由触发器增量维护
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS history_stats (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    total_count INTEGER NOT NULL DEFAULT 0,
+                    success_count INTEGER NOT NULL DEFAULT 0,
+                    total_size INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            
+            # 各平台计数（平台为空时以空字符串作为键）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS history_platform_stats (
+                    platform TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_history_stats_insert
+                AFTER INSERT ON download_history
+                WHEN NEW.is_latest = 1
+                BEGIN
+                    {_stats_delta_sql('NEW', '+')}
+                END
+            """)
+            
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_history_stats_update
+                AFTER UPDATE OF is_latest, status, file_size, platform ON download_history
+                BEGIN
+                    {_stats_delta_sql('OLD', '-')}
+                    {_stats_delta_sql('NEW', '+')}
+                END
+            """)
+            
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_history_stats_delete
+                AFTER DELETE ON download_history
+                WHEN OLD.is_latest = 1
+                BEGIN
+                    {_stats_delta_sql('OLD', '-')}
+                END
+            """)
+            
+            # 全文检索索引（不支持 FTS5 trigram 时回退到 LIKE 搜索）
+            self.fts_enabled = self._init_fts(cursor)
+            
+            # 统计表为新建（或旧版本数据库升级）时，从现有数据重建一次
+            cursor.execute("SELECT 1 FROM history_stats WHERE id = 1")
+            if cursor.fetchone() is None:
+                self._rebuild_statistics(cursor)
+                print("已重建统计计数")
+            
             # 创建索引以提高查询性能
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_download_time 
@@ -79,9 +421,138 @@ class HistoryManager:
                 ON download_history(status)
             """)
             
+            # 去重分组键索引（同时服务于按URL查询）
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_dedupe_key 
+                ON download_history(url, COALESCE(file_path, ''), id)
+            """)
+            
+            # 仅包含最新记录的部分索引，列表与统计直接走索引
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_latest_time 
+                ON download_history(download_time, id) WHERE is_latest = 1
+            """)
+            
+            # 各排序方式的 (排序键, id) 复合索引，支持游标分页直接定位
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_latest_size 
+                ON download_history(COALESCE(file_size, 0), id) WHERE is_latest = 1
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_latest_title 
+                ON download_history(COALESCE(title, ''), id) WHERE is_latest = 1
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_latest_platform_sort 
+                ON download_history(COALESCE(platform, ''), id) WHERE is_latest = 1
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_latest_status 
+                ON download_history(status, file_size) WHERE is_latest = 1
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_latest_platform 
+                ON download_history(platform) WHERE is_latest = 1
+            """)
+            
             conn.commit()
             print("数据库初始化完成")
     
+    def _init_fts(self, cursor: sqlite3.Cursor) -> bool:
+        """初始化标题、URL、文件名、平台的 FTS5 全文索引
+        
+        使用 trigram 分词，中文等无空格文本也能按子串检索；索引以外部内容表
+        方式引用 download_history，由触发器在插入、更新、删除时同步。
+        
+        Args:
+            cursor: 数据库游标（调用方负责提交）
+            
+        Returns:
+            bool: 全文索引是否可用
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'download_history_fts'")
+        exists = cursor.fetchone() is not None
+        if not exists:
+            try:
+                cursor.execute("""
+                    CREATE VIRTUAL TABLE download_history_fts USING fts5(
+                        title, url, file_name, platform,
+                        content='download_history', content_rowid='id',
+                        tokenize='trigram'
+                    )
+                """)
+            except sqlite3.OperationalError as e:
+                print(f"当前SQLite不支持FTS5 trigram，搜索将使用LIKE: {e}")
+                return False
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_history_fts_insert
+            AFTER INSERT ON download_history
+            BEGIN
+                INSERT INTO download_history_fts (rowid, title, url, file_name, platform)
+                VALUES (NEW.id, NEW.title, NEW.url, NEW.file_name, NEW.platform);
+            END
+        """)
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_history_fts_delete
+            AFTER DELETE ON download_history
+            BEGIN
+                INSERT INTO download_history_fts (download_history_fts, rowid, title, url, file_name, platform)
+                VALUES ('delete', OLD.id, OLD.title, OLD.url, OLD.file_name, OLD.platform);
+            END
+        """)
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_history_fts_update
+            AFTER UPDATE OF title, url, file_name, platform ON download_history
+            BEGIN
+                INSERT INTO download_history_fts (download_history_fts, rowid, title, url, file_name, platform)
+                VALUES ('delete', OLD.id, OLD.title, OLD.url, OLD.file_name, OLD.platform);
+                INSERT INTO download_history_fts (rowid, title, url, file_name, platform)
+                VALUES (NEW.id, NEW.title, NEW.url, NEW.file_name, NEW.platform);
+            END
+        """)
+        
+        if not exists:
+            # 为已有数据建立索引
+            cursor.execute("INSERT INTO download_history_fts (download_history_fts) VALUES ('rebuild')")
+            print("已建立历史记录全文索引")
+        return True
+    
+    def _rebuild_statistics(self, cursor: sqlite3.Cursor):
+        """从 is_latest 行重新计算统计计数
+        
+        Args:
+            cursor: 数据库游标（调用方负责提交）
+        """
+        cursor.execute("DELETE FROM history_stats")
+        cursor.execute("""
+            INSERT INTO history_stats (id, total_count, success_count, total_size)
+            SELECT 1, COUNT(*),
+                   COALESCE(SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN status = 'success' THEN COALESCE(file_size, 0) ELSE 0 END), 0)
+            FROM download_history WHERE is_latest = 1
+        """)
+        cursor.execute("DELETE FROM history_platform_stats")
+        cursor.execute("""
+            INSERT INTO history_platform_stats (platform, count)
+            SELECT COALESCE(platform, ''), COUNT(*) FROM download_history
+            WHERE is_latest = 1
+            GROUP BY COALESCE(platform, '')
+        """)
+    
+    def rebuild_statistics(self):
+        """重新计算统计计数（用于修复被外部工具修改过的数据库）"""
+        self._sync_pending()
+        with sqlite3.connect(self.db_path) as conn:
+            self._rebuild_statistics(conn.cursor())
+            conn.commit()
+    
     def add_record(self, url: str, title: str = None, file_path: str = None, 
                    file_name: str = None, thumbnail_path: str = None, 
                    file_size: int = 0, status: str = 'success', 
@@ -111,6 +582,7 @@ class HistoryManager:
                 print(f"URL已存在，返回现有记录ID: {existing_record['id']}")
                 return existing_record['id']
         
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -132,57 +604,105 @@ class HistoryManager:
     
     def get_records(self, limit: int = 100, offset: int = 0, 
                     search_keyword: str = None, platform: str = None,
-                    sort_by: str = 'download_time', sort_order: str = 'DESC') -> List[Dict]:
+                    sort_by: str = 'download_time', sort_order: str = 'DESC',
+                    after: Optional[Tuple] = None) -> List[Dict]:
         """获取历史记录列表
         
         Args:
             limit: 限制返回数量
-            offset: 偏移量
-            search_keyword: 搜索关键词（搜索标题和URL）
+            offset: 偏移量（传入 after 时通常为0）
+            search_keyword: 搜索关键词（搜索标题、URL、文件名和平台）
             platform: 平台筛选
-            sort_by: 排序字段
-            sort_order: 排序方向（ASC/DESC）
+            sort_by: 排序字段，'relevance' 表示按搜索相关度排序
+            sort_order: 排序方向（ASC/DESC，按相关度排序时忽略）
+            after: 游标分页位置，即上一页最后一条记录的 page_cursor()，
+                   返回其后的记录；按相关度排序时不支持
             
         Returns:
             List[Dict]: 历史记录列表
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row  # 使返回结果可以像字典一样访问
             cursor = conn.cursor()
             
-            # 构建查询条件
             where_conditions = []
             params = []
+            match_join = ""
+            fts_used = False
             
             if search_keyword:
-                where_conditions.append("(title LIKE ? OR url LIKE ?)")
-                params.extend([f"%{search_keyword}%", f"%{search_keyword}%"])
-            
-            if platform:
-                where_conditions.append("platform = ?")
-                params.append(platform)
-            
-            where_clause = ""
-            if where_conditions:
-                where_clause = "WHERE " + " AND ".join(where_conditions)
+                # 搜索时先筛选匹配的记录（含平台条件），再取每个URL+文件路径组合中最新的匹配记录；
+                # 组内较旧的记录匹配而最新记录不匹配时（如重新下载后标题变化）仍能搜到
+                match_conditions = []
+                match_params = []
+                # trigram 至少需要3个字符，更短的关键词使用 LIKE
+                if self.fts_enabled and len(search_keyword) >= 3:
+                    fts_used = True
+                    phrase = '"' + search_keyword.replace('"', '""') + '"'
+                    # MAX(id) 与裸列 rank 一起使用时，rank 取自 id 最大的那一行
+                    match_source = """
+                        SELECT MAX(d.id) AS id, fts.rank AS rank FROM download_history AS d
+                        JOIN (
+                            SELECT rowid, rank FROM download_history_fts
+                            WHERE download_history_fts MATCH ?
+                        ) AS fts ON fts.rowid = d.id
+                    """
+                    match_params.append(phrase)
+                else:
+                    match_source = "SELECT MAX(d.id) AS id, 0 AS rank FROM download_history AS d"
+                    pattern = f"%{search_keyword}%"
+                    match_conditions.append(
+                        "(d.title LIKE ? OR d.url LIKE ? OR d.file_name LIKE ? OR d.platform LIKE ?)"
+                    )
+                    match_params.extend([pattern] * 4)
+                if platform:
+                    match_conditions.append("d.platform = ?")
+                    match_params.append(platform)
+                match_where = ("WHERE " + " AND ".join(match_conditions)) if match_conditions else ""
+                match_join = f"""
+                    JOIN (
+                        {match_source}
+                        {match_where}
+                        GROUP BY d.url, COALESCE(d.file_path, '')
+                    ) AS hit ON hit.id = download_history.id
+                """
+                params.extend(match_params)
+            else:
+                # 不搜索时直接使用 is_latest 标记（每个URL+文件路径组合的最新记录）
+                where_conditions.append("is_latest = 1")
+                if platform:
+                    where_conditions.append("platform = ?")
+                    params.append(platform)
             
             # 验证排序字段
-            valid_sort_fields = ['download_time', 'file_size', 'title', 'platform']
-            if sort_by not in valid_sort_fields:
-                sort_by = 'download_time'
-            
-            if sort_order.upper() not in ['ASC', 'DESC']:
-                sort_order = 'DESC'
+            if sort_by == 'relevance' and fts_used:
+                order_clause = "hit.rank, download_history.id DESC"
+            else:
+                if sort_by not in _SORT_EXPRESSIONS:
+                    sort_by = 'download_time'
+                sort_order = sort_order.upper()
+                if sort_order not in ['ASC', 'DESC']:
+                    sort_order = 'DESC'
+                sort_expr = _SORT_EXPRESSIONS[sort_by]
+                # id 作为次级排序键，保证顺序稳定、游标唯一
+                order_clause = f"{sort_expr} {sort_order}, download_history.id {sort_order}"
+                
+                # 游标分页：从上一页最后一条记录之后继续，走 (排序键, id) 索引
+                if after is not None:
+                    op = '<' if sort_order == 'DESC' else '>'
+                    where_conditions.append(
+                        f"{sort_expr} {op}= ? AND ({sort_expr} {op} ? OR download_history.id {op} ?)"
+                    )
+                    params.extend([after[0], after[0], after[1]])
+            
+            where_clause = ("WHERE " + " AND ".join(where_conditions)) if where_conditions else ""
             
-            # 使用子查询去重，保留每个URL+文件路径组合的最新记录
             query = f"""
-                SELECT * FROM download_history 
-                WHERE id IN (
-                    SELECT MAX(id) FROM download_history 
-                    {where_clause}
-                    GROUP BY url, COALESCE(file_path, '')
-                )
-                ORDER BY {sort_by} {sort_order}
+                SELECT download_history.* FROM download_history 
+                {match_join}
+                {where_clause}
+                ORDER BY {order_clause}
                 LIMIT ? OFFSET ?
             """
             
@@ -193,6 +713,29 @@ class HistoryManager:
             
             return records
     
+    @staticmethod
+    def page_cursor(record: Dict, sort_by: str = 'download_time') -> Optional[Tuple]:
+        """根据记录生成游标分页位置，供 get_records(after=...) 使用
+        
+        Args:
+            record: 当前页最后一条记录
+            sort_by: 与 get_records 相同的排序字段
+            
+        Returns:
+            Optional[Tuple]: (排序键, id)，按相关度排序时返回None（需使用offset）
+        """
+        if not record or sort_by == 'relevance':
+            return None
+        if sort_by not in _SORT_EXPRESSIONS:
+            sort_by = 'download_time'
+        if sort_by == 'file_size':
+            key = record.get('file_size') or 0
+        elif sort_by == 'download_time':
+            key = record.get('download_time')
+        else:
+            key = record.get(sort_by) or ''
+        return (key, record.get('id'))
+    
     def get_record_by_id(self, record_id: int) -> Optional[Dict]:
         """根据ID获取单条记录
         
@@ -202,6 +745,7 @@ class HistoryManager:
         Returns:
             Optional[Dict]: 记录信息，不存在则返回None
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
@@ -227,6 +771,7 @@ class HistoryManager:
         # 添加更新时间
         kwargs['updated_at'] = datetime.now()
         
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -245,6 +790,55 @@ class HistoryManager:
             
             return success
     
+    def add_record_async(self, url: str, title: str = None, file_path: str = None,
+                         file_name: str = None, thumbnail_path: str = None,
+                         file_size: int = 0, status: str = 'success',
+                         platform: str = None, duration: str = None,
+                         force_create: bool = False):
+        """异步添加下载记录（后写队列批量提交，不返回记录ID）
+        
+        参数含义与 add_record 相同，URL重复检查在写入线程中执行。
+        """
+        now = datetime.now()
+        get_write_behind(self.db_path).submit_insert({
+            'url': url, 'title': title, 'file_path': file_path,
+            'file_name': file_name, 'thumbnail_path': thumbnail_path,
+            'file_size': file_size, 'status': status, 'platform': platform,
+            'duration': duration, 'download_time': now, 'updated_at': now
+        }, force_create=force_create)
+    
+    def update_record_async(self, record_id: int, **kwargs):
+        """异步更新记录（后写队列批量提交）
+        
+        Args:
+            record_id: 记录ID
+            **kwargs: 要更新的字段
+        """
+        if not kwargs:
+            return
+        kwargs['updated_at'] = datetime.now()
+        get_write_behind(self.db_path).submit_update(record_id, kwargs)
+    
+    def flush_pending(self, timeout: float = None) -> bool:
+        """将后写队列中的操作立即写入数据库
+        
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+            
+        Returns:
+            bool: 是否全部写入
+        """
+        writer = _write_behind_writers.get(os.path.abspath(self.db_path))
+        if writer is None:
+            return True
+        return writer.flush(timeout)
+    
+    def _sync_pending(self):
+        """同步操作前等待后写队列落盘，保证读写顺序一致"""
+        writer = _write_behind_writers.get(os.path.abspath(self.db_path))
+        if writer is not None and writer.has_pending():
+            writer.flush()
+    
     def delete_record(self, record_id: int) -> bool:
         """删除记录
         
@@ -254,6 +848,7 @@ class HistoryManager:
         Returns:
             bool: 是否删除成功
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -276,6 +871,7 @@ class HistoryManager:
         if not record_ids:
             return 0
         
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -296,6 +892,7 @@ class HistoryManager:
         Returns:
             int: 删除的记录数量
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -312,6 +909,7 @@ class HistoryManager:
         Returns:
             int: 删除的记录数量
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -331,56 +929,30 @@ class HistoryManager:
             return deleted_count
     
     def get_statistics(self) -> Dict:
-        """获取统计信息（应用去重逻辑）
+        """获取统计信息（应用去重逻辑，读取触发器维护的计数表）
         
         Returns:
             Dict: 统计信息
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
-            # 使用去重逻辑获取统计信息
-            # 总记录数（去重后）
+            # 总记录数、成功下载数、总文件大小（去重后）
             cursor.execute("""
-                SELECT COUNT(*) FROM (
-                    SELECT MAX(id) FROM download_history 
-                    GROUP BY url, COALESCE(file_path, '')
-                )
-            """)
-            total_count = cursor.fetchone()[0]
-            
-            # 成功下载数（去重后）
-            cursor.execute("""
-                SELECT COUNT(*) FROM download_history 
-                WHERE id IN (
-                    SELECT MAX(id) FROM download_history 
-                    GROUP BY url, COALESCE(file_path, '')
-                ) AND status = 'success'
-            """)
-            success_count = cursor.fetchone()[0]
-            
-            # 总文件大小（去重后）
-            cursor.execute("""
-                SELECT SUM(file_size) FROM download_history 
-                WHERE id IN (
-                    SELECT MAX(id) FROM download_history 
-                    GROUP BY url, COALESCE(file_path, '')
-                ) AND status = 'success'
+                SELECT total_count, success_count, total_size 
+                FROM history_stats WHERE id = 1
             """)
-            total_size = cursor.fetchone()[0] or 0
+            row = cursor.fetchone()
+            total_count, success_count, total_size = row if row else (0, 0, 0)
             
-            # 各平台统计（去重后）
+            # 各平台统计（去重后，空字符串键还原为 None）
             cursor.execute("""
-                SELECT platform, COUNT(*) as count 
-                FROM download_history 
-                WHERE id IN (
-                    SELECT MAX(id) FROM download_history 
-                    GROUP BY url, COALESCE(file_path, '')
-                )
-                GROUP BY platform 
+                SELECT platform, count 
+                FROM history_platform_stats 
                 ORDER BY count DESC
             """)
-            platform_stats = dict(cursor.fetchall())
+            platform_stats = {(p if p != '' else None): c for p, c in cursor.fetchall()}
             
             return {
                 'total_count': total_count,
@@ -410,6 +982,7 @@ class HistoryManager:
         Returns:
             Optional[Dict]: 如果存在返回记录信息，否则返回None
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -445,6 +1018,7 @@ class HistoryManager:
         if not file_path:
             return None
             
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -484,6 +1058,7 @@ class HistoryManager:
             return self.file_path_exists(potential_file_path)
         
         # 否则，查找该URL的所有成功下载记录，检查文件是否仍然存在
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -516,6 +1091,7 @@ class HistoryManager:
         Returns:
             List[str]: 平台列表
         """
+        self._sync_pending()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
@@ -1,299 +1,512 @@
 # -*- coding: utf-8 -*-
 """
 历史记录界面组件
-实现包含缩略图、文件信息、操作按钮的列表界面
+基于 QListView 的虚拟化列表：模型按需分页加载，委托只绘制可见行的缩略图、文件信息与操作按钮
 """
 
 import os
 import sys
+import math
+from collections import OrderedDict
 from datetime import datetime
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem,
-    QLabel, QPushButton, QLineEdit, QComboBox, QFrame, QSizePolicy,
-    QMessageBox, QMenu, QAction, QProgressBar, QScrollArea, QApplication,
-    QInputDialog
+    QWidget, QVBoxLayout, QHBoxLayout, QListView, QStyledItemDelegate, QStyle,
+    QLabel, QPushButton, QLineEdit, QComboBox, QMessageBox, QMenu, QApplication,
+    QInputDialog, QToolTip
 )
-from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal, QTimer
-from PyQt5.QtGui import QPixmap, QIcon, QFont, QPalette, QColor, QImage, QPainter
+from PyQt5.QtCore import (
+    Qt, QSize, QRect, QEvent, pyqtSignal, QTimer, QAbstractListModel, QModelIndex,
+    QObject, QRunnable, QThreadPool, QThread
+)
+from PyQt5.QtGui import QPixmap, QFont, QColor, QImage, QPainter, QPen, QFontMetrics, QCursor
 
 from history_manager import HistoryManager
+from thumbnail_extractor import get_thumbnail_extractor, is_valid_thumbnail
+
 
+# 模型中保存完整记录字典的角色
+RECORD_ROLE = Qt.UserRole + 1
 
-class ClickableLabel(QLabel):
-    """支持间隔双击重命名的标签"""
+
+def format_file_size(size_bytes):
+    """格式化文件大小"""
+    if size_bytes == 0:
+        return "0 B"
     
-    # 信号定义
-    rename_requested = pyqtSignal()  # 重命名请求信号
+    size_names = ["B", "KB", "MB", "GB", "TB"]
+    i = int(math.floor(math.log(size_bytes, 1024)))
+    p = math.pow(1024, i)
+    s = round(size_bytes / p, 2)
+    return f"{s} {size_names[i]}"
+
+
+def record_title(record):
+    """获取记录显示标题（使用文件名，去除扩展名）"""
+    file_path = record.get('file_path', '')
+    if file_path:
+        return os.path.splitext(os.path.basename(file_path))[0]
+    return record.get('title') or '未知标题'
+
+
+def render_thumbnail(path, size, deleted, crop=None):
+    """解码并缩放缩略图（可在后台线程中调用，只使用 QImage）
     
-    def __init__(self, text="", parent=None):
-        super().__init__(text, parent)
-        self.original_text = text
-        self.edit_mode = False
-        self.line_edit = None
-        
-        # 设置右键菜单
-        self.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.customContextMenuRequested.connect(self.show_context_menu)
+    Args:
+        path: 缩略图文件路径
+        size: 目标容器大小，按容器等比缩放
+        deleted: 文件是否已删除（是则转为灰度并叠加半透明效果）
+        crop: 先裁剪的区域 (x, y, 宽, 高)，用于从预览拼图中取单帧
+        
+    Returns:
+        QImage: 处理后的图片，失败时为空图片
+    """
+    image = QImage(path)
+    if image.isNull():
+        return image
+    if crop is not None:
+        image = image.copy(QRect(*crop))
+    image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    if deleted:
+        image = image.convertToFormat(QImage.Format_Grayscale8).convertToFormat(QImage.Format_ARGB32)
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode_SourceAtop)
+        painter.fillRect(image.rect(), QColor(255, 255, 255, 100))
+        painter.end()
+    return image
 
-    def show_context_menu(self, position):
-        """显示右键菜单"""
-        if self.edit_mode:
-            return
-            
-        menu = QMenu(self)
-        rename_action = menu.addAction("重命名文件")
-        rename_action.triggered.connect(self.request_file_rename)
-        
-        menu.exec_(self.mapToGlobal(position))
+
+class ThumbnailLoadSignals(QObject):
+    """后台解码任务的信号载体（QRunnable 本身不能发信号）"""
+    loaded = pyqtSignal(object, QImage)  # (缓存键, 图片)
+
+
+class ThumbnailLoadTask(QRunnable):
+    """后台解码缩放缩略图的任务"""
     
-    def request_file_rename(self):
-        """请求文件重命名"""
-        # 发出重命名信号，让父组件处理文件重命名逻辑
-        self.rename_requested.emit()
+    def __init__(self, key, path, size, deleted, crop, signals):
+        super().__init__()
+        self.key = key
+        self.path = path
+        self.size = size
+        self.deleted = deleted
+        self.crop = crop
+        self.signals = signals
+        
+    def run(self):
+        try:
+            image = render_thumbnail(self.path, self.size, self.deleted, self.crop)
+        except Exception as e:
+            print(f"解码缩略图失败 {self.path}: {e}")
+            image = QImage()
+        self.signals.loaded.emit(self.key, image)
+
+
+class ThumbnailLoader(QObject):
+    """异步缩略图加载器
     
-    def start_edit_mode(self):
-        """开始编辑模式"""
-        if self.edit_mode:
-            return
+    解码、缩放、灰度处理在线程池中完成，界面先显示占位图标，结果到达后
+    通过 thumbnail_ready 通知重绘。缩放后的 QPixmap 存入有界 LRU 缓存，
+    缓存键包含路径、修改时间和文件大小，文件被替换后自动失效。
+    """
+    
+    # 信号定义
+    thumbnail_ready = pyqtSignal(str)  # 缩略图路径
+    
+    _FAILED = object()  # 解码失败标记，避免反复重试
+    
+    def __init__(self, max_items=500, parent=None):
+        super().__init__(parent)
+        self.max_items = max_items
+        self.cache = OrderedDict()
+        self.pending = set()
+        self.stat_memo = {}  # 路径 -> (修改时间, 大小)，避免每次绘制都访问磁盘
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(2, min(4, QThread.idealThreadCount())))
+        self.signals = ThumbnailLoadSignals()
+        self.signals.loaded.connect(self._on_loaded)
+        
+    def pixmap(self, path, size, deleted, crop=None):
+        """获取缩放后的缩略图，尚未加载时提交后台任务并返回None"""
+        if path not in self.stat_memo:
+            try:
+                st = os.stat(path)
+                self.stat_memo[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                self.stat_memo[path] = None
+        file_state = self.stat_memo[path]
+        if file_state is None:
+            return None
+        
+        key = (path, file_state[0], file_state[1], size.width(), size.height(), deleted, crop)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            pixmap = self.cache[key]
+            return None if pixmap is self._FAILED else pixmap
+        
+        if key not in self.pending:
+            self.pending.add(key)
+            self.pool.start(ThumbnailLoadTask(key, path, QSize(size), deleted, crop, self.signals))
+        return None
+    
+    def invalidate(self, path=None):
+        """丢弃文件状态记忆（path为None时全部丢弃），下次绘制重新检查文件"""
+        if path is None:
+            self.stat_memo.clear()
+        else:
+            self.stat_memo.pop(path, None)
             
-        self.edit_mode = True
-        self.original_text = self.text()
-        
-        # 创建编辑框
-        self.line_edit = QLineEdit(self.original_text)
-        self.line_edit.setFont(self.font())
-        self.line_edit.setStyleSheet(self.styleSheet())
-        
-        # 替换标签为编辑框
-        layout = self.parent().layout()
-        if layout:
-            index = layout.indexOf(self)
-            if index >= 0:
-                layout.removeWidget(self)
-                layout.insertWidget(index, self.line_edit)
-                self.hide()
-                
-                # 连接信号
-                self.line_edit.editingFinished.connect(self.finish_edit_mode)
-                self.line_edit.returnPressed.connect(self.finish_edit_mode)
-                
-                # 选中所有文本并获得焦点
-                self.line_edit.selectAll()
-                self.line_edit.setFocus()
+    def _on_loaded(self, key, image):
+        """后台任务完成（在界面线程中执行）"""
+        self.pending.discard(key)
+        self.cache[key] = QPixmap.fromImage(image) if not image.isNull() else self._FAILED
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_items:
+            self.cache.popitem(last=False)
+        self.thumbnail_ready.emit(key[0])
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v')
+
+
+class ThumbnailRepairSignals(QObject):
+    """缩略图修复任务的信号载体"""
+    finished = pyqtSignal(int, str)  # (记录ID, 新缩略图路径，未修复时为空)
+    sprite_finished = pyqtSignal(int, bool)  # (记录ID, 是否生成成功)
+
+
+class ThumbnailRepairTask(QRunnable):
+    """后台检查并重新提取单条记录缩略图的任务"""
     
-    def finish_edit_mode(self):
-        """结束编辑模式"""
-        if not self.edit_mode or not self.line_edit:
+    def __init__(self, queue, record_id, file_path, thumbnail_path):
+        super().__init__()
+        self.queue = queue
+        self.record_id = record_id
+        self.file_path = file_path
+        self.thumbnail_path = thumbnail_path
+        
+    def run(self):
+        new_thumbnail_path = ''
+        try:
+            if not is_valid_thumbnail(self.thumbnail_path) and os.path.exists(self.file_path):
+                print(f"正在重新提取缩略图: {os.path.basename(self.file_path)}")
+                extracted = get_thumbnail_extractor().extract_thumbnail(self.file_path)
+                if extracted and os.path.exists(extracted):
+                    new_thumbnail_path = extracted
+                    print(f"缩略图重新提取成功: {extracted}")
+                else:
+                    print(f"缩略图提取失败: {self.file_path}")
+        except Exception as e:
+            print(f"检查缩略图时出错: {e}")
+        self.queue.signals.finished.emit(self.record_id, new_thumbnail_path)
+
+
+class SpriteSheetTask(QRunnable):
+    """后台生成悬停预览拼图的任务"""
+    
+    def __init__(self, queue, record_id, file_path):
+        super().__init__()
+        self.queue = queue
+        self.record_id = record_id
+        self.file_path = file_path
+        
+    def run(self):
+        ok = False
+        try:
+            ok = get_thumbnail_extractor().extract_sprite_sheet(self.file_path) is not None
+        except Exception as e:
+            print(f"生成预览拼图时出错: {e}")
+        self.queue.signals.sprite_finished.emit(self.record_id, ok)
+
+
+class ThumbnailRepairQueue(QObject):
+    """缩略图后台修复队列
+    
+    对已加载的记录做轻量校验（文件头/大小），缺失或损坏的缩略图交给有界线程池
+    重新提取，修复结果通过 thumbnail_repaired 信号逐条通知界面。
+    """
+    
+    # 信号定义
+    thumbnail_repaired = pyqtSignal(int, str)  # (记录ID, 新缩略图路径)
+    sprite_ready = pyqtSignal(int)  # 记录ID
+    
+    def __init__(self, max_workers=2, parent=None):
+        super().__init__(parent)
+        self.pending = set()
+        self.sprite_pending = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self.signals = ThumbnailRepairSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.sprite_finished.connect(self._on_sprite_finished)
+        
+    def submit(self, records):
+        """提交一批记录进行检查，已在队列中的记录会被跳过"""
+        for record in records:
+            record_id = record.get('id')
+            file_path = record.get('file_path') or ''
+            if not record_id or record_id in self.pending:
+                continue
+            if not file_path.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            self.pending.add(record_id)
+            self.pool.start(ThumbnailRepairTask(self, record_id, file_path, record.get('thumbnail_path') or ''))
+            
+    def submit_sprite(self, record):
+        """提交生成预览拼图的任务"""
+        record_id = record.get('id')
+        file_path = record.get('file_path') or ''
+        if not record_id or record_id in self.sprite_pending or not os.path.exists(file_path):
             return
+        self.sprite_pending.add(record_id)
+        self.pool.start(SpriteSheetTask(self, record_id, file_path))
             
-        new_text = self.line_edit.text().strip()
-        
-        # 恢复标签
-        layout = self.parent().layout()
-        if layout:
-            index = layout.indexOf(self.line_edit)
-            if index >= 0:
-                layout.removeWidget(self.line_edit)
-                layout.insertWidget(index, self)
-                self.show()
-        
-        # 清理编辑框
-        self.line_edit.deleteLater()
-        self.line_edit = None
-        self.edit_mode = False
-        
-        # 如果文本有变化，发出重命名信号
-        if new_text and new_text != self.original_text:
-            self.setText(new_text)
-            self.rename_requested.emit(new_text)
+    def _on_finished(self, record_id, thumbnail_path):
+        """任务完成（在界面线程中执行）"""
+        self.pending.discard(record_id)
+        if thumbnail_path:
+            self.thumbnail_repaired.emit(record_id, thumbnail_path)
+            
+    def _on_sprite_finished(self, record_id, ok):
+        """预览拼图任务完成（在界面线程中执行）"""
+        self.sprite_pending.discard(record_id)
+        if ok:
+            self.sprite_ready.emit(record_id)
 
 
-class CopyableLabel(QLabel):
-    """支持右键复制的标签"""
+class HistoryListModel(QAbstractListModel):
+    """历史记录列表模型
     
-    def __init__(self, text="", parent=None):
-        super().__init__(text, parent)
-        self.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.customContextMenuRequested.connect(self.show_context_menu)
+    通过 canFetchMore/fetchMore 按页向数据库请求记录（游标分页），
+    视图滚动到底部时才加载下一页。
+    """
     
-    def show_context_menu(self, position):
-        """显示右键菜单"""
-        menu = QMenu(self)
-        
-        # 复制链接动作
-        copy_action = QAction("复制链接", self)
-        copy_action.triggered.connect(self.copy_url)
-        menu.addAction(copy_action)
-        
-        # 显示菜单
-        menu.exec_(self.mapToGlobal(position))
+    # 信号定义
+    records_fetched = pyqtSignal(list)  # 新加载一页记录后发出
     
-    def copy_url(self):
-        """复制URL到剪贴板"""
-        text = self.text()
-        # 提取URL部分（去掉"链接: "前缀）
-        if text.startswith("链接: "):
-            url = text[4:]  # 去掉"链接: "前缀
-        else:
-            url = text
-        
-        clipboard = QApplication.clipboard()
-        clipboard.setText(url)
+    def __init__(self, history_manager, page_size=50, parent=None):
+        super().__init__(parent)
+        self.history_manager = history_manager
+        self.page_size = page_size
+        self.records = []
+        self.query = {}
+        self.page_cursor = None
+        self.has_more = False
+        
+    def set_query(self, search_keyword=None, platform=None,
+                  sort_by='download_time', sort_order='DESC'):
+        """设置查询条件并重新加载第一页"""
+        self.beginResetModel()
+        self.records = []
+        self.query = {
+            'search_keyword': search_keyword,
+            'platform': platform,
+            'sort_by': sort_by,
+            'sort_order': sort_order
+        }
+        self.page_cursor = None
+        self.has_more = True
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+        
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.records)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.records):
+            return None
+        record = self.records[index.row()]
+        if role == RECORD_ROLE:
+            return record
+        if role == Qt.DisplayRole:
+            return record_title(record)
+        if role == Qt.ToolTipRole:
+            return record.get('url', '')
+        return None
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self.has_more
+    
+    def fetchMore(self, parent=QModelIndex()):
+        """加载下一页记录（游标分页，按相关度排序时退回偏移分页）"""
+        if parent.isValid() or not self.has_more:
+            return
+        after = self.page_cursor if self.records else None
+        offset = 0 if after else len(self.records)
+        records = self.history_manager.get_records(
+            limit=self.page_size,
+            offset=offset,
+            after=after,
+            **self.query
+        )
+        self.has_more = len(records) == self.page_size
+        if not records:
+            return
+        self.page_cursor = self.history_manager.page_cursor(records[-1], self.query.get('sort_by'))
         
-        # 可以添加提示信息
-        print(f"已复制链接: {url}")
+        first = len(self.records)
+        self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+        self.records.extend(records)
+        self.endInsertRows()
+        self.records_fetched.emit(records)
+    
+    def row_of(self, record_id):
+        """根据记录ID查找行号，不存在返回-1"""
+        for row, record in enumerate(self.records):
+            if record.get('id') == record_id:
+                return row
+        return -1
+    
+    def refresh_row(self, row):
+        """通知视图重绘某一行"""
+        if 0 <= row < len(self.records):
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
 
 
-class HistoryItemWidget(QFrame):
-    """历史记录项组件"""
+class HistoryItemDelegate(QStyledItemDelegate):
+    """历史记录项绘制委托
+    
+    直接在视图上绘制缩略图、标题、链接、文件信息和操作按钮，
+    不为每条记录创建控件；按钮点击通过 action_triggered 信号通知界面。
+    """
     
     # 信号定义
-    open_folder_requested = pyqtSignal(str)  # 打开文件夹信号
-    delete_file_requested = pyqtSignal(int, str)  # 删除文件信号 (record_id, file_path)
-    delete_record_requested = pyqtSignal(int)  # 删除记录信号
-    redownload_requested = pyqtSignal(str, int)  # 重新下载信号 (url, record_id)
-    rename_requested = pyqtSignal(int, str)  # 重命名信号 (record_id, new_name)
+    action_triggered = pyqtSignal(str, dict)  # (动作名, 记录)
+    sprite_requested = pyqtSignal(dict)  # 需要生成预览拼图的记录
+    
+    ITEM_HEIGHT = 100
+    THUMB_HEIGHT = 80
+    THUMB_WIDTH = int(THUMB_HEIGHT * 4 / 3)  # 4:3比例
+    BUTTON_SIZE = 32
+    
+    # 操作按钮：(动作名, 图标, 提示)
+    BUTTONS = [
+        ('open_folder', "📁", "打开文件夹"),
+        ('delete_file', "🗑️", "删除文件"),
+        ('redownload', "🔄", "重新下载"),
+        ('delete_record', "❌", "删除记录"),
+    ]
+    
+    STATUS_TEXT = {'success': '成功', 'failed': '失败', 'downloading': '下载中'}
+    STATUS_COLOR = {'success': '#28a745', 'failed': '#dc3545', 'downloading': '#ffc107'}
     
-    def __init__(self, record_data, parent=None):
+    def __init__(self, parent=None):
         super().__init__(parent)
-        self.record_data = record_data
-        self.setup_ui()
-        
-    def setup_ui(self):
-        """设置UI界面"""
-        self.setFrameStyle(QFrame.Box)
-        self.setLineWidth(1)
-        # 设置固定高度，确保所有历史记录项高度一致
-        self.setFixedHeight(100)
-        
-        # 根据记录状态设置样式
-        status = self.record_data.get('status', 'success')
-        if status == 'file_deleted':
-            # 文件已删除状态 - 深灰色显示
-            self.setStyleSheet("""
-                HistoryItemWidget {
-                    background-color: #d6d8db;
-                    border: 1px solid #868e96;
-                    border-radius: 8px;
-                    margin: 2px;
-                }
-                HistoryItemWidget:hover {
-                    background-color: #ced4da;
-                    border-color: #6c757d;
-                }
-                QLabel {
-                    color: #495057;
-                }
-                QPushButton {
-                    background-color: #adb5bd;
-                    color: #495057;
-                    border: 1px solid #868e96;
-                    border-radius: 4px;
-                }
-                QPushButton:hover {
-                    background-color: #868e96;
-                    color: #343a40;
-                }
-            """)
-        else:
-            # 正常状态
-            self.setStyleSheet("""
-                HistoryItemWidget {
-                    background-color: #f8f9fa;
-                    border: 1px solid #dee2e6;
-                    border-radius: 8px;
-                    margin: 2px;
-                }
-                HistoryItemWidget:hover {
-                    background-color: #e9ecef;
-                    border-color: #adb5bd;
-                }
-            """)
-        
-        # 主布局
-        main_layout = QHBoxLayout(self)
-        main_layout.setContentsMargins(10, 8, 10, 8)
-        main_layout.setSpacing(12)
-        
-        # 缩略图区域 - 以容器高度为基准设置缩略图尺寸
-        thumbnail_height = 80  # 容器高度减去边距
-        thumbnail_width = int(thumbnail_height * 4 / 3)  # 4:3比例
-        self.thumbnail_label = QLabel()
-        self.thumbnail_label.setFixedSize(thumbnail_width, thumbnail_height)
-        # 根据状态设置缩略图样式
-        if status == 'file_deleted':
-            self.thumbnail_label.setStyleSheet("""
-                QLabel {
-                    border: 1px solid #868e96;
-                    border-radius: 4px;
-                    background-color: #ced4da;
-                    opacity: 0.5;
-                }
-            """)
+        self.title_font = QFont('Microsoft YaHei', 10, QFont.Bold)
+        self.text_font = QFont('Microsoft YaHei', 8)
+        self.detail_font = QFont('Microsoft YaHei', 7)
+        self.button_font = QFont()
+        self.button_font.setPixelSize(16)
+        self.hover_button_font = QFont()
+        self.hover_button_font.setPixelSize(18)
+        self.hover = None  # (行号, 动作名)
+        self.scrub = None  # (行号, 横向位置比例)，鼠标在缩略图上移动时显示对应帧
+        self.sprite_memo = {}  # 记录ID -> 预览拼图信息（None 表示没有或正在生成）
+        self.thumbnails = ThumbnailLoader(parent=self)
+        
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self.ITEM_HEIGHT)
+    
+    def item_rect(self, rect):
+        """记录卡片区域"""
+        return rect.adjusted(2, 2, -2, -2)
+    
+    def thumbnail_rect(self, rect):
+        """缩略图区域"""
+        card = self.item_rect(rect)
+        top = card.top() + (card.height() - self.THUMB_HEIGHT) // 2
+        return QRect(card.left() + 10, top, self.THUMB_WIDTH, self.THUMB_HEIGHT)
+    
+    def button_rects(self, rect):
+        """操作按钮区域（右侧2x2排列）"""
+        card = self.item_rect(rect)
+        size = self.BUTTON_SIZE
+        spacing = 4
+        left = card.right() - 10 - size * 2 - spacing
+        top = card.top() + (card.height() - size * 2 - spacing) // 2
+        rects = {}
+        for i, (action, _, _) in enumerate(self.BUTTONS):
+            col, row = i % 2, i // 2
+            rects[action] = QRect(left + col * (size + spacing), top + row * (size + spacing), size, size)
+        return rects
+    
+    def button_at(self, rect, pos):
+        """返回位置所在的按钮动作名"""
+        for action, button_rect in self.button_rects(rect).items():
+            if button_rect.contains(pos):
+                return action
+        return None
+    
+    def paint(self, painter, option, index):
+        record = index.data(RECORD_ROLE)
+        if not record:
+            return
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.TextAntialiasing)
+        
+        status = record.get('status', 'success')
+        deleted = status == 'file_deleted'
+        hovered = bool(option.state & QStyle.State_MouseOver)
+        
+        # 卡片背景：文件已删除时深灰色显示
+        if deleted:
+            background = '#ced4da' if hovered else '#d6d8db'
+            border = '#6c757d' if hovered else '#868e96'
         else:
-            self.thumbnail_label.setStyleSheet("""
-                QLabel {
-                    border: 1px solid #ced4da;
-                    border-radius: 4px;
-                    background-color: #ffffff;
-                }
-            """)
-        self.thumbnail_label.setAlignment(Qt.AlignCenter)
-        # 不使用setScaledContents，改为在load_thumbnail中手动缩放
-        
-        # 加载缩略图
-        self.load_thumbnail()
-        
-        # 左侧：缩略图区域
-        main_layout.addWidget(self.thumbnail_label)
+            background = '#e9ecef' if hovered else '#f8f9fa'
+            border = '#adb5bd' if hovered else '#dee2e6'
+        card = self.item_rect(option.rect)
+        painter.setPen(QPen(QColor(border), 1))
+        painter.setBrush(QColor(background))
+        painter.drawRoundedRect(card, 8, 8)
+        
+        # 左侧：缩略图
+        thumb_rect = self.thumbnail_rect(option.rect)
+        scrub = self.scrub[1] if self.scrub and self.scrub[0] == index.row() else None
+        self.paint_thumbnail(painter, thumb_rect, record, scrub)
+        
+        # 右侧：操作按钮
+        button_rects = self.button_rects(option.rect)
+        for action, icon, _ in self.BUTTONS:
+            is_hover = self.hover == (index.row(), action)
+            painter.setFont(self.hover_button_font if is_hover else self.button_font)
+            painter.setPen(QColor('#495057'))
+            painter.drawText(button_rects[action], Qt.AlignCenter, icon)
         
         # 中间：信息区域
-        info_layout = QVBoxLayout()
-        info_layout.setSpacing(4)
-        
-        # 标题（使用文件名，去除扩展名）- 支持双击重命名
-        file_path = self.record_data.get('file_path', '')
-        if file_path:
-            # 获取文件名并去除扩展名
-            file_name = os.path.basename(file_path)
-            title_text = os.path.splitext(file_name)[0]  # 去除扩展名
-        else:
-            title_text = self.record_data.get('title', '未知标题')
-        
-        self.title_label = ClickableLabel(title_text)
-        self.title_label.setFont(QFont('Microsoft YaHei', 10, QFont.Bold))
-        self.title_label.setStyleSheet("color: #212529;")
-        self.title_label.setWordWrap(True)
-        # 连接重命名信号
-        self.title_label.rename_requested.connect(self.on_title_rename)
-        info_layout.addWidget(self.title_label)
-        
-        # URL（完整显示，支持自动换行和右键复制）
-        full_url = self.record_data.get('url', '')
-        self.url_label = CopyableLabel(f"链接: {full_url}")
-        self.url_label.setFont(QFont('Microsoft YaHei', 8))
-        self.url_label.setStyleSheet("color: #6c757d;")
-        self.url_label.setWordWrap(True)  # 启用自动换行
-        self.url_label.setTextInteractionFlags(Qt.TextSelectableByMouse)  # 允许选择文本
-        info_layout.addWidget(self.url_label)
-        
-        # 文件路径
-        file_path = self.record_data.get('file_path', '')
-        if file_path:
-            file_name = os.path.basename(file_path)
-            path_label = QLabel(f"文件: {file_name}")
-        else:
-            path_label = QLabel("文件: 未找到")
-        path_label.setFont(QFont('Microsoft YaHei', 8))
-        path_label.setStyleSheet("color: #495057;")
-        info_layout.addWidget(path_label)
-        
-        # 详细信息行
-        details_layout = QHBoxLayout()
-        details_layout.setSpacing(15)
-        
-        # 下载时间
-        download_time = self.record_data.get('download_time', '')
+        left = thumb_rect.right() + 12
+        right = min(r.left() for r in button_rects.values()) - 12
+        width = max(0, right - left)
+        y = card.top() + 8
+        
+        text_color = '#495057' if deleted else '#212529'
+        y = self.draw_line(painter, self.title_font, text_color, record_title(record), left, y, width)
+        y = self.draw_line(painter, self.text_font, '#6c757d', f"链接: {record.get('url', '')}", left, y + 2, width)
+        
+        file_path = record.get('file_path', '')
+        file_text = f"文件: {os.path.basename(file_path)}" if file_path else "文件: 未找到"
+        y = self.draw_line(painter, self.text_font, '#495057', file_text, left, y + 2, width)
+        
+        self.paint_details(painter, record, left, y + 4, width)
+        painter.restore()
+        
+    def draw_line(self, painter, font, color, text, left, top, width):
+        """绘制单行省略文本，返回下一行的起始纵坐标"""
+        metrics = QFontMetrics(font)
+        painter.setFont(font)
+        painter.setPen(QColor(color))
+        elided = metrics.elidedText(text, Qt.ElideRight, width)
+        painter.drawText(QRect(left, top, width, metrics.height()), Qt.AlignLeft | Qt.AlignVCenter, elided)
+        return top + metrics.height()
+    
+    def paint_details(self, painter, record, left, top, width):
+        """绘制详细信息行：时间、大小、平台、状态"""
+        download_time = record.get('download_time', '')
         if download_time:
             try:
                 dt = datetime.fromisoformat(download_time.replace('Z', '+00:00'))
@@ -302,248 +515,141 @@ class HistoryItemWidget(QFrame):
                 time_str = download_time
         else:
             time_str = '未知时间'
-        time_label = QLabel(f"时间: {time_str}")
-        time_label.setFont(QFont('Microsoft YaHei', 7))
-        time_label.setStyleSheet("color: #868e96;")
-        details_layout.addWidget(time_label)
-        
-        # 文件大小
-        file_size = self.record_data.get('file_size', 0)
-        if file_size and file_size > 0:
-            size_str = self.format_file_size(file_size)
-        else:
-            size_str = '未知大小'
-        size_label = QLabel(f"大小: {size_str}")
-        size_label.setFont(QFont('Microsoft YaHei', 7))
-        size_label.setStyleSheet("color: #868e96;")
-        details_layout.addWidget(size_label)
-        
-        # 平台
-        platform = self.record_data.get('platform', '未知')
-        platform_label = QLabel(f"平台: {platform}")
-        platform_label.setFont(QFont('Microsoft YaHei', 7))
-        platform_label.setStyleSheet("color: #868e96;")
-        details_layout.addWidget(platform_label)
-        
-        # 状态
-        status = self.record_data.get('status', 'unknown')
-        status_text = {'success': '成功', 'failed': '失败', 'downloading': '下载中'}.get(status, '未知')
-        status_color = {'success': '#28a745', 'failed': '#dc3545', 'downloading': '#ffc107'}.get(status, '#6c757d')
-        status_label = QLabel(f"状态: {status_text}")
-        status_label.setFont(QFont('Microsoft YaHei', 7))
-        status_label.setStyleSheet(f"color: {status_color}; font-weight: bold;")
-        details_layout.addWidget(status_label)
-        
-        details_layout.addStretch()
-        info_layout.addLayout(details_layout)
-        
-        info_layout.addStretch()
-        main_layout.addLayout(info_layout, 1)
         
-        # 右侧：操作按钮区域
-        buttons_layout = QVBoxLayout()
-        buttons_layout.setSpacing(6)
-        buttons_layout.setContentsMargins(0, 0, 0, 0)  # 移除上下边距
-        buttons_layout.setAlignment(Qt.AlignTop)  # 顶部对齐
-        
-        # 打开文件夹按钮
-        open_folder_btn = QPushButton("📁")
-        open_folder_btn.setFixedSize(35, 35)
-        open_folder_btn.setToolTip("打开文件夹")  # 悬浮提示
-        open_folder_btn.setStyleSheet("""
-            QPushButton {
-                background: transparent;
-                border: none;
-                font-size: 16px;
-            }
-            QPushButton:hover {
-                font-size: 18px;
-            }
-        """)
-        open_folder_btn.clicked.connect(self.open_folder)
-        buttons_layout.addWidget(open_folder_btn, 0, Qt.AlignCenter)
-        
-        # 删除文件按钮
-        delete_file_btn = QPushButton("🗑️")
-        delete_file_btn.setFixedSize(35, 35)
-        delete_file_btn.setToolTip("删除文件")  # 悬浮提示
-        delete_file_btn.setStyleSheet("""
-            QPushButton {
-                background: transparent;
-                border: none;
-                font-size: 16px;
-            }
-            QPushButton:hover {
-                font-size: 18px;
-            }
-        """)
-        delete_file_btn.clicked.connect(self.delete_file)
-        buttons_layout.addWidget(delete_file_btn, 0, Qt.AlignCenter)
-        
-        # 重新下载按钮
-        redownload_btn = QPushButton("🔄")
-        redownload_btn.setFixedSize(35, 35)
-        redownload_btn.setToolTip("重新下载")  # 悬浮提示
-        redownload_btn.setStyleSheet("""
-            QPushButton {
-                background: transparent;
-                border: none;
-                font-size: 16px;
-            }
-            QPushButton:hover {
-                font-size: 18px;
-            }
-        """)
-        redownload_btn.clicked.connect(self.redownload)
-        buttons_layout.addWidget(redownload_btn, 0, Qt.AlignCenter)
-        
-        # 删除记录按钮
-        delete_record_btn = QPushButton("❌")
-        delete_record_btn.setFixedSize(35, 35)
-        delete_record_btn.setToolTip("删除记录")  # 悬浮提示
-        delete_record_btn.setStyleSheet("""
-            QPushButton {
-                background: transparent;
-                border: none;
-                font-size: 16px;
-            }
-            QPushButton:hover {
-                font-size: 18px;
-            }
-        """)
-        delete_record_btn.clicked.connect(self.delete_record)
-        buttons_layout.addWidget(delete_record_btn, 0, Qt.AlignCenter)
-        
-        main_layout.addLayout(buttons_layout)
-        
-    def load_thumbnail(self):
-        """加载缩略图 - 以容器高度为标准等比缩放"""
-        thumbnail_path = self.record_data.get('thumbnail_path', '')
-        status = self.record_data.get('status', 'success')
-        
-        if thumbnail_path and os.path.exists(thumbnail_path):
-            pixmap = QPixmap(thumbnail_path)
-            if not pixmap.isNull():
-                # 获取缩略图标签的实际尺寸
-                label_size = self.thumbnail_label.size()
-                
-                # 以高度为标准进行等比缩放，确保图片高度占满容器
-                scaled_pixmap = pixmap.scaledToHeight(
-                    label_size.height(),
-                    Qt.SmoothTransformation
-                )
-                
-                # 如果缩放后宽度超过容器宽度，则以宽度为标准缩放
-                if scaled_pixmap.width() > label_size.width():
-                    scaled_pixmap = pixmap.scaledToWidth(
-                        label_size.width(),
-                        Qt.SmoothTransformation
-                    )
-                
-                # 如果文件已删除，应用灰度滤镜
-                if status == 'file_deleted':
-                    # 转换为灰度图像
-                    gray_image = scaled_pixmap.toImage().convertToFormat(QImage.Format_Grayscale8)
-                    gray_pixmap = QPixmap.fromImage(gray_image)
-                    
-                    # 创建半透明效果
-                    painter = QPainter(gray_pixmap)
-                    painter.setCompositionMode(QPainter.CompositionMode_SourceAtop)
-                    painter.fillRect(gray_pixmap.rect(), QColor(255, 255, 255, 100))
-                    painter.end()
-                    
-                    self.thumbnail_label.setPixmap(gray_pixmap)
-                else:
-                    self.thumbnail_label.setPixmap(scaled_pixmap)
-                return
-        
-        # 显示默认图标
-        if status == 'file_deleted':
-            self.thumbnail_label.setText("🎬")
-            self.thumbnail_label.setStyleSheet("""
-                QLabel {
-                    border: 1px solid #868e96;
-                    border-radius: 4px;
-                    background-color: #ced4da;
-                    font-size: 24px;
-                    color: #868e96;
-                }
-            """)
-        else:
-            self.thumbnail_label.setText("🎬")
-            self.thumbnail_label.setStyleSheet("""
-                QLabel {
-                    border: 1px solid #ced4da;
-                    border-radius: 4px;
-                    background-color: #f8f9fa;
-                    font-size: 24px;
-                }
-            """)
+        file_size = record.get('file_size', 0)
+        size_str = format_file_size(file_size) if file_size and file_size > 0 else '未知大小'
+        
+        status = record.get('status', 'unknown')
+        segments = [
+            (f"时间: {time_str}", '#868e96', False),
+            (f"大小: {size_str}", '#868e96', False),
+            (f"平台: {record.get('platform', '未知')}", '#868e96', False),
+            (f"状态: {self.STATUS_TEXT.get(status, '未知')}", self.STATUS_COLOR.get(status, '#6c757d'), True),
+        ]
+        
+        x = left
+        end = left + width
+        for text, color, bold in segments:
+            font = QFont(self.detail_font)
+            font.setBold(bold)
+            metrics = QFontMetrics(font)
+            text_width = metrics.horizontalAdvance(text)
+            if x >= end:
+                break
+            painter.setFont(font)
+            painter.setPen(QColor(color))
+            painter.drawText(QRect(x, top, end - x, metrics.height()), Qt.AlignLeft | Qt.AlignVCenter,
+                             metrics.elidedText(text, Qt.ElideRight, end - x))
+            x += text_width + 15
+    
+    def paint_thumbnail(self, painter, rect, record, scrub=None):
+        """绘制缩略图，缺失时显示默认图标；scrub 不为空时显示预览拼图中对应的帧"""
+        status = record.get('status', 'success')
+        deleted = status == 'file_deleted'
         
-    def format_file_size(self, size_bytes):
-        """格式化文件大小"""
-        if size_bytes == 0:
-            return "0 B"
+        painter.setPen(QPen(QColor('#868e96' if deleted else '#ced4da'), 1))
+        painter.setBrush(QColor('#ced4da' if deleted else '#ffffff'))
+        painter.drawRoundedRect(rect, 4, 4)
         
-        size_names = ["B", "KB", "MB", "GB", "TB"]
-        import math
-        i = int(math.floor(math.log(size_bytes, 1024)))
-        p = math.pow(1024, i)
-        s = round(size_bytes / p, 2)
-        return f"{s} {size_names[i]}"
+        if scrub is not None and self.paint_scrub_frame(painter, rect, record, scrub, deleted):
+            return
         
-    def open_folder(self):
-        """打开文件夹"""
-        file_path = self.record_data.get('file_path', '')
-        if file_path:
-            self.open_folder_requested.emit(file_path)
+        thumbnail_path = record.get('thumbnail_path', '')
+        pixmap = self.thumbnails.pixmap(thumbnail_path, rect.size(), deleted) if thumbnail_path else None
+        if pixmap is not None:
+            x = rect.left() + (rect.width() - pixmap.width()) // 2
+            y = rect.top() + (rect.height() - pixmap.height()) // 2
+            painter.drawPixmap(x, y, pixmap)
+            return
         
-    def delete_file(self):
-        """删除文件"""
-        record_id = self.record_data.get('id')
-        file_path = self.record_data.get('file_path', '')
-        if record_id and file_path:
-            self.delete_file_requested.emit(record_id, file_path)
-            
-    def delete_record(self):
-        """删除记录"""
-        record_id = self.record_data.get('id')
-        if record_id:
-            self.delete_record_requested.emit(record_id)
-            
-    def redownload(self):
-        """重新下载"""
-        url = self.record_data.get('url', '')
-        record_id = self.record_data.get('id')
-        if url and record_id:
-            self.redownload_requested.emit(url, record_id)
+        # 显示默认图标（缩略图缺失或仍在后台加载）
+        font = QFont()
+        font.setPixelSize(24)
+        painter.setFont(font)
+        painter.setPen(QColor('#868e96'))
+        painter.drawText(rect, Qt.AlignCenter, "🎬")
     
-    def on_title_rename(self):
-        """处理标题重命名"""
-        record_id = self.record_data.get('id')
-        if record_id:
-            # 弹出重命名对话框
-            current_file_path = self.record_data.get('file_path', '')
-            if not current_file_path or not os.path.exists(current_file_path):
-                QMessageBox.warning(self, "错误", "文件不存在，无法重命名")
-                return
-                
-            # 获取当前文件名（不含扩展名）
-            current_name = os.path.splitext(os.path.basename(current_file_path))[0]
-            
-            # 弹出输入对话框
-            new_name, ok = QInputDialog.getText(
-                self, "重命名文件", 
-                "请输入新的文件名（不含扩展名）:", 
-                QLineEdit.Normal, 
-                current_name
-            )
-            
-            if ok and new_name.strip():
-                # 发出重命名信号，让父组件处理文件重命名逻辑
-                print(f"[DEBUG] 发出重命名信号: record_id={record_id}, new_name={new_name.strip()}")
-                self.rename_requested.emit(record_id, new_name.strip())
-                print(f"[DEBUG] 重命名信号已发出")
+    def paint_scrub_frame(self, painter, rect, record, scrub, deleted):
+        """绘制预览拼图中与鼠标位置对应的帧和进度条，拼图不可用时返回False"""
+        info = self.sprite_info(record)
+        if not info:
+            return False
+        frame = min(int(scrub * info['frames']), info['frames'] - 1)
+        offset = info['offsets'][frame]
+        crop = (offset['x'], offset['y'], info['tile_width'], info['tile_height'])
+        pixmap = self.thumbnails.pixmap(info['sprite'], rect.size(), deleted, crop)
+        if pixmap is None:
+            return False
+        x = rect.left() + (rect.width() - pixmap.width()) // 2
+        y = rect.top() + (rect.height() - pixmap.height()) // 2
+        painter.drawPixmap(x, y, pixmap)
+        
+        # 底部进度条
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(0, 0, 0, 120))
+        painter.drawRect(rect.left(), rect.bottom() - 3, rect.width(), 3)
+        painter.setBrush(QColor('#0d6efd'))
+        painter.drawRect(rect.left(), rect.bottom() - 3, int(rect.width() * (frame + 1) / info['frames']), 3)
+        return True
+    
+    def sprite_info(self, record):
+        """获取记录的预览拼图信息（只在悬停时读取一次），不存在时请求后台生成"""
+        record_id = record.get('id')
+        if record_id in self.sprite_memo:
+            return self.sprite_memo[record_id]
+        file_path = record.get('file_path') or ''
+        info = None
+        if file_path.lower().endswith(VIDEO_EXTENSIONS) and os.path.exists(file_path):
+            info = get_thumbnail_extractor().load_sprite_info(file_path)
+            if info is None:
+                self.sprite_requested.emit(record)
+        self.sprite_memo[record_id] = info
+        return info
+    
+    def clear_hover(self):
+        """清除悬停状态"""
+        self.hover = None
+        self.scrub = None
+    
+    def eventFilter(self, obj, event):
+        """鼠标离开列表时清除悬停与预览状态"""
+        if event.type() == QEvent.Leave and (self.hover or self.scrub):
+            self.clear_hover()
+            obj.update()
+        return super().eventFilter(obj, event)
+    
+    def editorEvent(self, event, model, option, index):
+        """处理按钮的悬停与点击，以及缩略图上的预览拖动"""
+        if event.type() == QEvent.MouseMove:
+            action = self.button_at(option.rect, event.pos())
+            hover = (index.row(), action) if action else None
+            thumb_rect = self.thumbnail_rect(option.rect)
+            scrub = None
+            if thumb_rect.contains(event.pos()):
+                scrub = (index.row(), (event.pos().x() - thumb_rect.left()) / max(1, thumb_rect.width()))
+            if hover != self.hover or scrub != self.scrub:
+                self.hover = hover
+                self.scrub = scrub
+                if option.widget is not None:
+                    option.widget.viewport().update()
+        elif event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            action = self.button_at(option.rect, event.pos())
+            if action:
+                record = index.data(RECORD_ROLE)
+                if record:
+                    self.action_triggered.emit(action, record)
+                return True
+        return super().editorEvent(event, model, option, index)
+    
+    def helpEvent(self, event, view, option, index):
+        """按钮区域显示对应的悬浮提示"""
+        if event.type() == QEvent.ToolTip:
+            action = self.button_at(option.rect, event.pos())
+            if action:
+                tips = {a: tip for a, _, tip in self.BUTTONS}
+                QToolTip.showText(event.globalPos(), tips[action], view)
+                return True
+        return super().helpEvent(event, view, option, index)
 
 
 class HistoryWidget(QWidget):
@@ -552,9 +658,7 @@ class HistoryWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.history_manager = HistoryManager()
-        self.current_page = 1
         self.page_size = 20
-        self.current_records = []
         self.setup_ui()
         self.load_history()
         
@@ -595,7 +699,7 @@ class HistoryWidget(QWidget):
             "按时间降序", "按时间升序", 
             "按大小降序", "按大小升序",
             "按标题A-Z", "按标题Z-A",
-            "按平台分组"
+            "按平台分组", "按相关度"
         ])
         self.sort_combo.setFixedHeight(32)
         self.sort_combo.setStyleSheet("""
@@ -687,50 +791,44 @@ class HistoryWidget(QWidget):
         """)
         layout.addWidget(self.stats_label)
         
-        # 历史记录列表区域
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        self.scroll_area.setStyleSheet("""
-            QScrollArea {
+        # 历史记录列表区域：虚拟化列表，只绘制可见行，滚动到底部时按页加载
+        self.history_model = HistoryListModel(self.history_manager, page_size=self.page_size, parent=self)
+        self.history_model.records_fetched.connect(self.on_records_fetched)
+        
+        # 缩略图后台修复队列
+        self.thumbnail_repair = ThumbnailRepairQueue(parent=self)
+        self.thumbnail_repair.thumbnail_repaired.connect(self.on_thumbnail_repaired)
+        self.thumbnail_repair.sprite_ready.connect(self.on_sprite_ready)
+        self.history_model.rowsInserted.connect(lambda *args: self.update_stats())
+        self.history_model.modelReset.connect(lambda *args: self.update_stats())
+        
+        self.item_delegate = HistoryItemDelegate(self)
+        self.item_delegate.action_triggered.connect(self.on_item_action)
+        self.item_delegate.sprite_requested.connect(self.thumbnail_repair.submit_sprite)
+        # 缩略图在后台解码完成后重绘可见区域
+        self.item_delegate.thumbnails.thumbnail_ready.connect(lambda path: self.list_view.viewport().update())
+        
+        self.list_view = QListView()
+        self.list_view.setModel(self.history_model)
+        self.list_view.setItemDelegate(self.item_delegate)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setSpacing(3)
+        self.list_view.setMouseTracking(True)
+        self.list_view.viewport().installEventFilter(self.item_delegate)
+        self.list_view.setSelectionMode(QListView.NoSelection)
+        self.list_view.setVerticalScrollMode(QListView.ScrollPerPixel)
+        self.list_view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.list_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.list_view.customContextMenuRequested.connect(self.show_context_menu)
+        self.list_view.doubleClicked.connect(self.on_item_double_clicked)
+        self.list_view.setStyleSheet("""
+            QListView {
                 border: 1px solid #dee2e6;
                 border-radius: 6px;
                 background-color: white;
             }
         """)
-        
-        # 列表容器
-        self.list_widget = QWidget()
-        self.list_layout = QVBoxLayout(self.list_widget)
-        self.list_layout.setContentsMargins(5, 5, 5, 5)
-        self.list_layout.setSpacing(5)
-        self.list_layout.setAlignment(Qt.AlignTop)  # 设置顶部对齐
-        
-        self.scroll_area.setWidget(self.list_widget)
-        layout.addWidget(self.scroll_area, 1)
-        
-        # 加载更多按钮
-        self.load_more_btn = QPushButton("加载更多")
-        self.load_more_btn.setFixedHeight(36)
-        self.load_more_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #6c757d;
-                color: white;
-                border: none;
-                border-radius: 6px;
-                font-size: 12px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #545b62;
-            }
-            QPushButton:pressed {
-                background-color: #3d4147;
-            }
-        """)
-        self.load_more_btn.clicked.connect(self.load_more_history)
-        layout.addWidget(self.load_more_btn)
+        layout.addWidget(self.list_view, 1)
         
         # 初始化平台列表
         self.update_platform_list()
@@ -756,12 +854,8 @@ class HistoryWidget(QWidget):
         except Exception as e:
             print(f"更新平台列表失败: {e}")
             
-    def load_history(self, reset_page=True):
+    def load_history(self):
         """加载历史记录"""
-        if reset_page:
-            self.current_page = 1
-            self.clear_list()
-            
         try:
             # 获取搜索和筛选条件
             keyword = self.search_input.text().strip()
@@ -773,33 +867,17 @@ class HistoryWidget(QWidget):
             sort_text = self.sort_combo.currentText()
             sort_by, sort_order = self.parse_sort_option(sort_text)
             
-            # 查询历史记录
-            offset = (self.current_page - 1) * self.page_size
-            records = self.history_manager.get_records(
-                limit=self.page_size,
-                offset=offset,
+            # 重新查询第一页，后续页面由列表滚动时按需加载
+            self.item_delegate.thumbnails.invalidate()
+            self.item_delegate.sprite_memo.clear()
+            self.item_delegate.clear_hover()
+            self.history_model.set_query(
                 search_keyword=keyword if keyword else None,
                 platform=platform,
                 sort_by=sort_by,
                 sort_order=sort_order
             )
-            
-            if reset_page:
-                self.current_records = records
-            else:
-                self.current_records.extend(records)
-                
-            # 添加记录到界面并检查缩略图
-            for record in records:
-                # 检查并重新提取缺失的缩略图
-                self.check_and_extract_thumbnail(record)
-                self.add_history_item(record)
-                
-            # 更新统计信息
-            self.update_stats()
-            
-            # 更新加载更多按钮状态
-            self.load_more_btn.setVisible(len(records) == self.page_size)
+            self.list_view.scrollToTop()
             
         except Exception as e:
             print(f"加载历史记录失败: {e}")
@@ -814,30 +892,109 @@ class HistoryWidget(QWidget):
             "按大小升序": ("file_size", "ASC"),
             "按标题A-Z": ("title", "ASC"),
             "按标题Z-A": ("title", "DESC"),
-            "按平台分组": ("platform", "ASC")
+            "按平台分组": ("platform", "ASC"),
+            "按相关度": ("relevance", "DESC")  # 仅在搜索时生效，否则按时间降序
         }
         return sort_map.get(sort_text, ("download_time", "DESC"))
         
-    def add_history_item(self, record):
-        """添加历史记录项到界面"""
-        item_widget = HistoryItemWidget(record)
+    def on_records_fetched(self, records):
+        """新一页记录加载完成"""
+        # 缺失或损坏的缩略图在后台修复，不阻塞列表加载
+        self.thumbnail_repair.submit(records)
+        
+    def on_thumbnail_repaired(self, record_id, thumbnail_path):
+        """缩略图修复完成：批量写回数据库并只刷新对应行"""
+        self.history_manager.update_record_async(record_id, thumbnail_path=thumbnail_path)
+        row = self.history_model.row_of(record_id)
+        if row < 0:
+            return
+        self.history_model.records[row]['thumbnail_path'] = thumbnail_path
+        self.item_delegate.thumbnails.invalidate(thumbnail_path)
+        self.history_model.refresh_row(row)
+        
+    def on_sprite_ready(self, record_id):
+        """预览拼图生成完成，下次悬停时重新读取"""
+        self.item_delegate.sprite_memo.pop(record_id, None)
+        self.history_model.refresh_row(self.history_model.row_of(record_id))
+            
+    def on_item_action(self, action, record):
+        """处理列表项按钮与菜单动作"""
+        record_id = record.get('id')
+        file_path = record.get('file_path', '')
+        url = record.get('url', '')
+        if action == 'open_folder':
+            if file_path:
+                self.open_folder(file_path)
+        elif action == 'delete_file':
+            if record_id and file_path:
+                self.delete_file(record_id, file_path)
+        elif action == 'delete_record':
+            if record_id:
+                self.delete_record(record_id)
+        elif action == 'redownload':
+            if url and record_id:
+                self.redownload(url, record_id)
+        elif action == 'rename':
+            self.request_rename(record)
+        elif action == 'copy_url':
+            QApplication.clipboard().setText(url)
+            print(f"已复制链接: {url}")
+            
+    def show_context_menu(self, position):
+        """显示列表项右键菜单"""
+        index = self.list_view.indexAt(position)
+        record = index.data(RECORD_ROLE) if index.isValid() else None
+        if not record:
+            return
         
-        # 连接信号
-        item_widget.open_folder_requested.connect(self.open_folder)
-        item_widget.delete_file_requested.connect(self.delete_file)
-        item_widget.delete_record_requested.connect(self.delete_record)
-        item_widget.redownload_requested.connect(self.redownload)
-        item_widget.rename_requested.connect(self.rename_file)  # 连接重命名信号
+        menu = QMenu(self)
+        actions = [
+            ('copy_url', "复制链接"),
+            ('rename', "重命名文件"),
+            (None, None),
+        ] + [(action, tip) for action, _, tip in HistoryItemDelegate.BUTTONS]
+        for action, text in actions:
+            if action is None:
+                menu.addSeparator()
+                continue
+            menu_action = menu.addAction(text)
+            menu_action.triggered.connect(lambda checked=False, a=action: self.on_item_action(a, record))
+        menu.exec_(self.list_view.viewport().mapToGlobal(position))
+        
+    def on_item_double_clicked(self, index):
+        """双击标题区域重命名文件"""
+        record = index.data(RECORD_ROLE)
+        if not record:
+            return
+        pos = self.list_view.viewport().mapFromGlobal(QCursor.pos())
+        rect = self.list_view.visualRect(index)
+        if self.item_delegate.button_at(rect, pos) or self.item_delegate.thumbnail_rect(rect).contains(pos):
+            return
+        self.request_rename(record)
         
-        # 直接添加到布局末尾
-        self.list_layout.addWidget(item_widget)
+    def request_rename(self, record):
+        """弹出重命名对话框"""
+        record_id = record.get('id')
+        if not record_id:
+            return
+        current_file_path = record.get('file_path', '')
+        if not current_file_path or not os.path.exists(current_file_path):
+            QMessageBox.warning(self, "错误", "文件不存在，无法重命名")
+            return
+            
+        # 获取当前文件名（不含扩展名）
+        current_name = os.path.splitext(os.path.basename(current_file_path))[0]
+        
+        # 弹出输入对话框
+        new_name, ok = QInputDialog.getText(
+            self, "重命名文件", 
+            "请输入新的文件名（不含扩展名）:", 
+            QLineEdit.Normal, 
+            current_name
+        )
         
-    def clear_list(self):
-        """清空列表"""
-        while self.list_layout.count():
-            child = self.list_layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+        if ok and new_name.strip():
+            self.rename_file(record_id, new_name.strip())
                 
     def update_stats(self):
         """更新统计信息"""
@@ -849,7 +1006,7 @@ class HistoryWidget(QWidget):
             
             size_str = self.format_file_size(total_size) if total_size > 0 else "0 B"
             
-            stats_text = f"总计: {total_count} 条记录 | 成功: {success_count} 条 | 总大小: {size_str} | 当前显示: {len(self.current_records)} 条"
+            stats_text = f"总计: {total_count} 条记录 | 成功: {success_count} 条 | 总大小: {size_str} | 当前显示: {self.history_model.rowCount()} 条"
             self.stats_label.setText(stats_text)
             
         except Exception as e:
@@ -858,15 +1015,7 @@ class HistoryWidget(QWidget):
             
     def format_file_size(self, size_bytes):
         """格式化文件大小"""
-        if size_bytes == 0:
-            return "0 B"
-        
-        size_names = ["B", "KB", "MB", "GB", "TB"]
-        import math
-        i = int(math.floor(math.log(size_bytes, 1024)))
-        p = math.pow(1024, i)
-        s = round(size_bytes / p, 2)
-        return f"{s} {size_names[i]}"
+        return format_file_size(size_bytes)
         
     def on_search_changed(self):
         """搜索内容变化"""
@@ -876,26 +1025,21 @@ class HistoryWidget(QWidget):
         
         self.search_timer = QTimer()
         self.search_timer.setSingleShot(True)
-        self.search_timer.timeout.connect(lambda: self.load_history(True))
+        self.search_timer.timeout.connect(lambda: self.load_history())
         self.search_timer.start(500)  # 500ms延迟
         
     def on_sort_changed(self):
         """排序方式变化"""
-        self.load_history(True)
+        self.load_history()
         
     def on_platform_changed(self):
         """平台筛选变化"""
-        self.load_history(True)
-        
-    def load_more_history(self):
-        """加载更多历史记录"""
-        self.current_page += 1
-        self.load_history(False)
+        self.load_history()
         
     def refresh_history(self):
         """刷新历史记录"""
         self.update_platform_list()
-        self.load_history(True)
+        self.load_history()
         
     def clear_all_history(self):
         """清空所有历史记录"""
@@ -983,60 +1127,6 @@ class HistoryWidget(QWidget):
             except Exception as e:
                 QMessageBox.warning(self, "错误", f"删除记录失败: {e}")
                 
-    def check_and_extract_thumbnail(self, record):
-        """检查并重新提取缺失的缩略图"""
-        try:
-            from thumbnail_extractor import ThumbnailExtractor
-            import os
-            
-            file_path = record.get('file_path', '')
-            thumbnail_path = record.get('thumbnail_path', '')
-            
-            # 检查是否为视频文件
-            if not file_path or not os.path.exists(file_path):
-                return
-                
-            video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v']
-            if not any(file_path.lower().endswith(ext) for ext in video_extensions):
-                return
-                
-            # 检查缩略图是否存在且有效
-            need_extract = False
-            if not thumbnail_path or not os.path.exists(thumbnail_path):
-                need_extract = True
-            else:
-                # 检查缩略图文件是否损坏（文件大小为0或无法读取）
-                try:
-                    if os.path.getsize(thumbnail_path) == 0:
-                        need_extract = True
-                    else:
-                        # 尝试加载图片验证是否有效
-                        from PyQt5.QtGui import QPixmap
-                        pixmap = QPixmap(thumbnail_path)
-                        if pixmap.isNull():
-                            need_extract = True
-                except Exception:
-                    need_extract = True
-                    
-            # 如果需要重新提取缩略图
-            if need_extract:
-                print(f"正在重新提取缩略图: {os.path.basename(file_path)}")
-                extractor = ThumbnailExtractor()
-                new_thumbnail_path = extractor.extract_thumbnail(file_path)
-                
-                if new_thumbnail_path and os.path.exists(new_thumbnail_path):
-                    # 更新数据库中的缩略图路径
-                    record_id = record.get('id')
-                    if record_id:
-                        self.history_manager.update_record(record_id, thumbnail_path=new_thumbnail_path)
-                        record['thumbnail_path'] = new_thumbnail_path  # 更新内存中的记录
-                        print(f"缩略图重新提取成功: {new_thumbnail_path}")
-                else:
-                    print(f"缩略图提取失败: {file_path}")
-                    
-        except Exception as e:
-            print(f"检查缩略图时出错: {e}")
-    
     def redownload(self, url, record_id):
         """重新下载"""
         try:
@@ -6,24 +6,228 @@
 
 import os
 import sys
+import math
+import json
+import functools
+import shutil
+import sqlite3
+import hashlib
+import queue
+import threading
 import subprocess
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# 常见缩略图格式的文件头
+_IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',          # JPEG
+    b'\x89PNG\r\n\x1a\n',    # PNG
+    b'RIFF',                   # WEBP
+    b'GIF8',                   # GIF
+    b'BM',                     # BMP
+)
+
+
+def is_valid_thumbnail(thumbnail_path):
+    """
+    快速检查缩略图文件是否有效（只读取文件头尾，不解码整张图片）
+    
+    Args:
+        thumbnail_path (str): 缩略图路径
+        
+    Returns:
+        bool: 文件存在、非空、格式头正确且JPEG未被截断时返回True
+    """
+    if not thumbnail_path:
+        return False
+    try:
+        with open(thumbnail_path, 'rb') as f:
+            header = f.read(16)
+            if not header.startswith(_IMAGE_SIGNATURES):
+                return False
+            if header.startswith(b'\xff\xd8'):
+                # JPEG 以 EOI 标记结尾，写入中断的文件缺少该标记
+                f.seek(-2, os.SEEK_END)
+                return f.read(2) == b'\xff\xd9'
+            return True
+    except OSError:
+        return False
+
+
+FFMPEG_CAPABILITY_CACHE = os.path.join("config", "ffmpeg_capabilities.json")
+
+# 关心的图片编码器
+_IMAGE_ENCODERS = ('mjpeg', 'png', 'libwebp', 'webp', 'bmp')
+
+
+def _binary_fingerprint(path):
+    """可执行文件的指纹（路径、修改时间、大小），用于判断缓存是否失效"""
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+        return {'path': path, 'mtime': st.st_mtime, 'size': st.st_size}
+    except OSError:
+        return None
+
+
+def _run_ffmpeg_query(ffmpeg_path, *args):
+    """执行ffmpeg查询命令并返回标准输出，失败返回空字符串"""
+    try:
+        result = subprocess.run([ffmpeg_path, '-hide_banner', *args], capture_output=True, text=True, timeout=5)
+        return result.stdout if result.returncode == 0 else ''
+    except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
+        return ''
+
+
+def probe_ffmpeg_capabilities(cache_path=FFMPEG_CAPABILITY_CACHE):
+    """
+    探测ffmpeg/ffprobe的路径、版本和能力，结果缓存到磁盘
+    
+    缓存以可执行文件的修改时间和大小为依据，二进制文件未变化时不启动任何子进程。
+    
+    Args:
+        cache_path (str): 缓存文件路径
+        
+    Returns:
+        dict: available/ffmpeg/ffprobe/version/filters/encoders
+    """
+    ffmpeg = _binary_fingerprint(shutil.which('ffmpeg'))
+    ffprobe = _binary_fingerprint(shutil.which('ffprobe'))
+    if ffmpeg is None:
+        return {'available': False, 'ffmpeg': None, 'ffprobe': ffprobe, 'version': '', 'filters': [], 'encoders': []}
+    
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('ffmpeg') == ffmpeg and cached.get('ffprobe') == ffprobe:
+            return cached
+    except (OSError, ValueError):
+        pass
+    
+    version_output = _run_ffmpeg_query(ffmpeg['path'], '-version')
+    if not version_output:
+        return {'available': False, 'ffmpeg': ffmpeg, 'ffprobe': ffprobe, 'version': '', 'filters': [], 'encoders': []}
+    version = version_output.splitlines()[0].split(' Copyright')[0].replace('ffmpeg version ', '').strip()
+    
+    # -filters 每行形如 " T.. scale  V->V  描述"
+    filters = []
+    for line in _run_ffmpeg_query(ffmpeg['path'], '-filters').splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and '->' in parts[2]:
+            filters.append(parts[1])
+            
+    # -encoders 每行形如 " V....D mjpeg  描述"
+    encoders = []
+    for line in _run_ffmpeg_query(ffmpeg['path'], '-encoders').splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].startswith('V') and parts[1] in _IMAGE_ENCODERS:
+            encoders.append(parts[1])
+    
+    capabilities = {
+        'available': True,
+        'ffmpeg': ffmpeg,
+        'ffprobe': ffprobe,
+        'version': version,
+        'filters': filters,
+        'encoders': encoders,
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(capabilities, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"保存ffmpeg能力缓存失败: {e}")
+    print(f"ffmpeg能力探测完成: {version}")
+    return capabilities
+
+
+_placeholder_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _placeholder_font():
+    """加载占位图字体（只加载一次），返回(字体, 是否支持中文)"""
+    try:
+        # 尝试使用系统字体
+        if sys.platform == 'win32':
+            font_path = 'C:/Windows/Fonts/msyh.ttc'  # 微软雅黑
+        else:
+            font_path = None
+        if font_path and os.path.exists(font_path):
+            return ImageFont.truetype(font_path, 12), True
+    except Exception:
+        pass
+    return ImageFont.load_default(), False
+
+
+@functools.lru_cache(maxsize=1)
+def _render_placeholder():
+    """渲染默认占位图 (320x240)，结果缓存在内存中"""
+    img = Image.new('RGB', (320, 240), color='#f8f9fa')
+    draw = ImageDraw.Draw(img)
+    
+    # 绘制边框
+    draw.rectangle([0, 0, 319, 239], outline='#dee2e6', width=2)
+    
+    # 绘制视频图标
+    # 播放按钮三角形
+    triangle_points = [(140, 100), (140, 140), (180, 120)]
+    draw.polygon(triangle_points, fill='#6c757d')
+    
+    # 绘制说明文字
+    font, cjk = _placeholder_font()
+    text = "暂无预览" if cjk else "No preview"
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_x = (320 - (bbox[2] - bbox[0])) // 2
+    draw.text((text_x, 160), text, fill='#495057', font=font)
+    return img
+
+
+_shared_extractor = None
+_shared_extractor_lock = threading.Lock()
+
+
+def get_thumbnail_extractor():
+    """
+    获取共享的缩略图提取器（首次调用时创建）
+    
+    Returns:
+        ThumbnailExtractor: 全局共享实例
+    """
+    global _shared_extractor
+    with _shared_extractor_lock:
+        if _shared_extractor is None:
+            _shared_extractor = ThumbnailExtractor()
+        return _shared_extractor
 
 
 class ThumbnailExtractor:
     """视频缩略图提取器"""
     
-    def __init__(self, thumbnail_dir="thumbnails"):
+    # 未能探测到视频时长时使用的提取时间点
+    DEFAULT_TIMESTAMP = "00:00:05"
+    
+    # 预览拼图格式版本；旧版本（只解码关键帧，画面可能重复）会被视为不存在并重新生成
+    SPRITE_VERSION = 2
+    
+    # 缩放并填充到 320x240
+    SCALE_FILTER = 'scale=320:240:force_original_aspect_ratio=decrease,pad=320:240:(ow-iw)/2:(oh-ih)/2'
+    
+    def __init__(self, thumbnail_dir="thumbnails", fast_seek=True):
         """
         初始化缩略图提取器
         
         Args:
             thumbnail_dir (str): 缩略图保存目录
+            fast_seek (bool): 是否使用快速定位（输入端 -ss，只解码关键帧），失败时自动回退到精确模式
         """
         self.thumbnail_dir = Path(thumbnail_dir)
         self.thumbnail_dir.mkdir(exist_ok=True)
+        self.fast_seek = fast_seek
         
         # 支持的视频格式
         self.video_extensions = {
@@ -31,30 +235,41 @@ class ThumbnailExtractor:
             '.webm', '.m4v', '.3gp', '.ts', '.m2ts'
         }
         
-        # 检查ffmpeg是否可用
-        self.ffmpeg_available = self._check_ffmpeg()
+        # ffmpeg能力在首次使用时探测
+        self._capabilities = None
+        self._capabilities_lock = threading.Lock()
         
-    def _check_ffmpeg(self):
+    @property
+    def capabilities(self):
+        """ffmpeg能力信息（延迟探测，优先读取磁盘缓存）"""
+        with self._capabilities_lock:
+            if self._capabilities is None:
+                self._capabilities = probe_ffmpeg_capabilities()
+            return self._capabilities
+        
+    @property
+    def ffmpeg_available(self):
         """检查ffmpeg是否可用"""
-        try:
-            result = subprocess.run(
-                ['ffmpeg', '-version'], 
-                capture_output=True, 
-                text=True, 
-                timeout=5
-            )
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
-            return False
+        return self.capabilities['available']
+    
+    @property
+    def ffmpeg_path(self):
+        """ffmpeg可执行文件路径"""
+        return (self.capabilities.get('ffmpeg') or {}).get('path') or 'ffmpeg'
+    
+    @property
+    def ffprobe_path(self):
+        """ffprobe可执行文件路径，未找到时返回None"""
+        return (self.capabilities.get('ffprobe') or {}).get('path')
             
-    def extract_thumbnail(self, video_path, output_path=None, timestamp="00:00:05"):
+    def extract_thumbnail(self, video_path, output_path=None, timestamp=None):
         """
         从视频文件提取缩略图
         
         Args:
             video_path (str): 视频文件路径
             output_path (str): 输出缩略图路径，如果为None则自动生成
-            timestamp (str): 提取时间点，格式为HH:MM:SS
+            timestamp (str): 提取时间点，格式为HH:MM:SS或秒数，为None时按视频时长自动选择
             
         Returns:
             str: 缩略图文件路径，失败返回None
@@ -72,9 +287,10 @@ class ThumbnailExtractor:
                 print(f"不支持的视频格式: {video_path.suffix}")
                 return self._create_default_thumbnail(video_path.name, output_path)
                 
-            # 生成输出路径
-            if output_path is None:
-                output_path = self.thumbnail_dir / f"{video_path.stem}_thumb.jpg"
+            # 生成输出路径（自动生成的路径记入索引）
+            auto_path = output_path is None
+            if auto_path:
+                output_path = Path(self.get_thumbnail_path(video_path))
             else:
                 output_path = Path(output_path)
                 
@@ -83,53 +299,137 @@ class ThumbnailExtractor:
             
             # 使用ffmpeg提取缩略图
             if self.ffmpeg_available:
-                return self._extract_with_ffmpeg(video_path, output_path, timestamp)
+                thumbnail_path = self._extract_with_ffmpeg(video_path, output_path, timestamp)
             else:
                 print("ffmpeg不可用，创建默认缩略图")
-                return self._create_default_thumbnail(video_path.name, output_path)
+                thumbnail_path = self._create_default_thumbnail(video_path.name, output_path)
+                
+            if auto_path and thumbnail_path == str(output_path):
+                self._index_thumbnail(video_path, thumbnail_path)
+            return thumbnail_path
                 
         except Exception as e:
             print(f"提取缩略图时出错: {e}")
             return self._create_default_thumbnail(video_path.name if 'video_path' in locals() else "unknown", output_path)
             
-    def _extract_with_ffmpeg(self, video_path, output_path, timestamp):
+    def _probe_duration(self, video_path):
         """
-        使用ffmpeg提取缩略图
+        使用ffprobe获取视频时长
+        
+        Args:
+            video_path (Path): 视频文件路径
+            
+        Returns:
+            float: 时长（秒），获取失败返回None
+        """
+        if not self.ffprobe_path:
+            return None
+        try:
+            result = subprocess.run(
+                [self.ffprobe_path, '-v', 'error', '-show_entries', 'format=duration',
+                 '-of', 'default=noprint_wrappers=1:nokey=1', str(video_path)],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            if result.returncode == 0:
+                return float(result.stdout.strip())
+        except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError, ValueError):
+            pass
+        return None
+        
+    def pick_timestamp(self, duration):
+        """
+        根据视频时长选择提取时间点（约10%处，短视频不超过结尾前0.5秒）
+        
+        Args:
+            duration (float): 视频时长（秒），None表示未知
+            
+        Returns:
+            str: 时间点
+        """
+        if not duration or duration <= 0:
+            return self.DEFAULT_TIMESTAMP
+        seconds = min(duration * 0.1, max(duration - 0.5, 0))
+        return f"{seconds:.3f}"
+        
+    def _run_ffmpeg(self, cmd, output_path):
+        """执行ffmpeg命令，返回(是否成功, 错误输出)"""
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            timeout=30  # 30秒超时
+        )
+        ok = result.returncode == 0 and output_path.exists() and output_path.stat().st_size > 0
+        return ok, result.stderr
+        
+    def build_ffmpeg_command(self, video_path, output_path, timestamp, fast):
+        """
+        构建提取单帧的ffmpeg命令
         
         Args:
             video_path (Path): 视频文件路径
             output_path (Path): 输出路径
             timestamp (str): 时间点
+            fast (bool): True 为输入端定位并只解码关键帧，False 为从头解码到时间点的精确模式
             
         Returns:
-            str: 缩略图路径
+            list: 命令参数
         """
-        try:
-            # ffmpeg命令
-            cmd = [
-                'ffmpeg',
-                '-i', str(video_path),
+        if fast:
+            return [
+                self.ffmpeg_path, '-v', 'error',
+                '-skip_frame', 'nokey',
                 '-ss', timestamp,
-                '-vframes', '1',
-                '-vf', 'scale=320:240:force_original_aspect_ratio=decrease,pad=320:240:(ow-iw)/2:(oh-ih)/2',
+                '-noaccurate_seek',
+                '-i', str(video_path),
+                '-frames:v', '1',
+                '-vf', self.SCALE_FILTER,
                 '-y',  # 覆盖输出文件
                 str(output_path)
             ]
+        return [
+            self.ffmpeg_path,
+            '-i', str(video_path),
+            '-ss', timestamp,
+            '-vframes', '1',
+            '-vf', self.SCALE_FILTER,
+            '-y',  # 覆盖输出文件
+            str(output_path)
+        ]
+        
+    def _extract_with_ffmpeg(self, video_path, output_path, timestamp):
+        """
+        使用ffmpeg提取缩略图
+        
+        Args:
+            video_path (Path): 视频文件路径
+            output_path (Path): 输出路径
+            timestamp (str): 时间点，为None时按探测到的时长自动选择
             
-            # 执行命令
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30  # 30秒超时
-            )
-            
-            if result.returncode == 0 and output_path.exists():
-                print(f"成功提取缩略图: {output_path}")
-                return str(output_path)
-            else:
-                print(f"ffmpeg提取失败: {result.stderr}")
-                return self._create_default_thumbnail(video_path.name, output_path)
+        Returns:
+            str: 缩略图路径
+        """
+        try:
+            if timestamp is None:
+                timestamp = self.pick_timestamp(self._probe_duration(video_path))
+                
+            modes = [True, False] if self.fast_seek else [False]
+            stderr = ''
+            for fast in modes:
+                # 删除旧文件，避免把上次的输出误判为成功
+                if output_path.exists():
+                    output_path.unlink()
+                ok, stderr = self._run_ffmpeg(self.build_ffmpeg_command(video_path, output_path, timestamp, fast), output_path)
+                if ok:
+                    print(f"成功提取缩略图: {output_path}")
+                    return str(output_path)
+                if fast:
+                    print(f"快速提取失败，改用精确模式: {video_path.name}")
+                    
+            print(f"ffmpeg提取失败: {stderr}")
+            return self._create_default_thumbnail(video_path.name, output_path)
                 
         except subprocess.TimeoutExpired:
             print("ffmpeg提取超时")
@@ -140,142 +440,569 @@ class ThumbnailExtractor:
             
     def _create_default_thumbnail(self, filename, output_path=None):
         """
-        创建默认缩略图
+        获取默认缩略图
+        
+        所有提取失败的文件共用同一张占位图，只在不存在时渲染并写入一次。
         
         Args:
-            filename (str): 文件名
-            output_path (Path): 输出路径
+            filename (str): 文件名（仅用于日志）
+            output_path (Path): 保留参数，占位图不再按文件单独生成
             
         Returns:
             str: 缩略图路径
         """
         try:
-            if output_path is None:
-                output_path = self.thumbnail_dir / f"default_thumb.jpg"
-            else:
-                output_path = Path(output_path)
-                
-            # 确保输出目录存在
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # 创建默认图片 (320x240)
-            img = Image.new('RGB', (320, 240), color='#f8f9fa')
-            draw = ImageDraw.Draw(img)
-            
-            # 绘制边框
-            draw.rectangle([0, 0, 319, 239], outline='#dee2e6', width=2)
-            
-            # 绘制视频图标
-            # 播放按钮三角形
-            triangle_points = [(140, 100), (140, 140), (180, 120)]
-            draw.polygon(triangle_points, fill='#6c757d')
-            
-            # 绘制文件名（如果有字体的话）
-            try:
-                # 尝试使用系统字体
-                if sys.platform == 'win32':
-                    font_path = 'C:/Windows/Fonts/msyh.ttc'  # 微软雅黑
-                else:
-                    font_path = None
-                    
-                if font_path and os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, 12)
-                else:
-                    font = ImageFont.load_default()
-                    
-                # 截断文件名
-                display_name = filename[:25] + '...' if len(filename) > 25 else filename
-                
-                # 计算文本位置
-                bbox = draw.textbbox((0, 0), display_name, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_x = (320 - text_width) // 2
-                
-                draw.text((text_x, 160), display_name, fill='#495057', font=font)
-                
-            except Exception:
-                # 如果字体加载失败，使用默认字体
-                display_name = filename[:20] + '...' if len(filename) > 20 else filename
-                draw.text((80, 160), display_name, fill='#495057')
-                
-            # 保存图片
-            img.save(output_path, 'JPEG', quality=85)
-            print(f"创建默认缩略图: {output_path}")
-            return str(output_path)
+            placeholder = self.thumbnail_dir / "default_thumb.jpg"
+            with _placeholder_lock:
+                if not is_valid_thumbnail(str(placeholder)):
+                    placeholder.parent.mkdir(parents=True, exist_ok=True)
+                    # 先写临时文件再替换，避免并行提取时读到半张图
+                    temp_path = placeholder.with_suffix('.tmp')
+                    _render_placeholder().save(temp_path, 'JPEG', quality=85)
+                    os.replace(temp_path, placeholder)
+                    print(f"创建默认缩略图: {placeholder}")
+            print(f"使用默认缩略图: {filename}")
+            return str(placeholder)
             
         except Exception as e:
             print(f"创建默认缩略图失败: {e}")
             return None
             
-    def extract_multiple_thumbnails(self, video_files, progress_callback=None):
+    def extract_multiple_thumbnails(self, video_files, progress_callback=None,
+                                    max_workers=None, cancel_event=None, skip_up_to_date=True):
         """
-        批量提取缩略图
+        批量提取缩略图（线程池并行执行，每个线程驱动一个ffmpeg子进程）
         
         Args:
             video_files (list): 视频文件路径列表
-            progress_callback (callable): 进度回调函数
+            progress_callback (callable): 进度回调函数 (已完成数, 总数, 文件路径)，在调用线程中执行
+            max_workers (int): 并行数量，默认为CPU核心数
+            cancel_event (threading.Event): 取消事件，置位后不再启动新的提取任务
+            skip_up_to_date (bool): 缩略图比视频新时跳过提取，直接返回已有缩略图
             
         Returns:
-            dict: {video_path: thumbnail_path} 映射
+            dict: {video_path: thumbnail_path} 映射，取消后未处理的文件不在结果中
         """
         results = {}
         total = len(video_files)
+        done = 0
+        cancelled = object()
+        
+        def extract_one(video_file):
+            if cancel_event is not None and cancel_event.is_set():
+                return cancelled
+            if skip_up_to_date:
+                thumbnail_path = self.get_thumbnail_path(video_file)
+                try:
+                    if os.path.getmtime(thumbnail_path) >= os.path.getmtime(video_file):
+                        return thumbnail_path
+                except OSError:
+                    pass
+            return self.extract_thumbnail(video_file)
         
-        for i, video_file in enumerate(video_files):
+        workers = max_workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=min(workers, max(total, 1))) as executor:
+            futures = {executor.submit(extract_one, video_file): video_file for video_file in video_files}
             try:
-                thumbnail_path = self.extract_thumbnail(video_file)
-                results[video_file] = thumbnail_path
-                
-                if progress_callback:
-                    progress_callback(i + 1, total, video_file)
+                for future in as_completed(futures):
+                    video_file = futures[future]
+                    try:
+                        thumbnail_path = future.result()
+                        if thumbnail_path is cancelled:
+                            continue
+                        results[video_file] = thumbnail_path
+                    except Exception as e:
+                        print(f"处理文件 {video_file} 时出错: {e}")
+                        results[video_file] = None
                     
-            except Exception as e:
-                print(f"处理文件 {video_file} 时出错: {e}")
-                results[video_file] = None
-                
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, total, video_file)
+                        
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+            finally:
+                for future in futures:
+                    future.cancel()
+                    
+        if cancel_event is not None and cancel_event.is_set():
+            print(f"批量提取已取消: 完成 {len(results)}/{total}")
         return results
         
+    def adopt_thumbnail(self, video_path, thumbnail_file):
+        """
+        把已生成的缩略图文件（如下载过程中生成的临时文件）移动到视频对应的缩略图路径
+        
+        Args:
+            video_path (str): 视频文件路径
+            thumbnail_file (str): 已生成的缩略图文件
+            
+        Returns:
+            str: 缩略图路径，失败返回None
+        """
+        try:
+            target = Path(self.get_thumbnail_path(video_path))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(thumbnail_file, target)
+            self._index_thumbnail(video_path, str(target))
+            return str(target)
+        except OSError as e:
+            print(f"保存缩略图失败 {thumbnail_file}: {e}")
+            return None
+        
+    def get_sprite_paths(self, video_path):
+        """
+        获取视频对应的预览拼图及其信息文件路径（与缩略图使用同一个键）
+        
+        Args:
+            video_path (str): 视频文件路径
+            
+        Returns:
+            tuple: (拼图路径, JSON信息路径)
+        """
+        key = self.thumbnail_key(video_path)
+        shard = self.thumbnail_dir / key[:2]
+        return shard / f"{key}_sprite.jpg", shard / f"{key}_sprite.json"
+        
+    def extract_sprite_sheet(self, video_path, frames=10, columns=5, tile_width=160, tile_height=120):
+        """
+        一次ffmpeg调用生成均匀分布的多帧拼图（用于悬停预览），并写出记录各帧位置的JSON
+        
+        需要完整解码视频：只解码关键帧时，抽帧间隔小于关键帧间隔会让 fps 滤镜重复上一关键帧，
+        拼图中的画面与记录的时间点对不上。
+        
+        Args:
+            video_path (str): 视频文件路径
+            frames (int): 帧数
+            columns (int): 每行帧数
+            tile_width (int): 单帧宽度
+            tile_height (int): 单帧高度
+            
+        Returns:
+            dict: 拼图信息（见 load_sprite_info），失败返回None
+        """
+        video_path = Path(video_path)
+        if not video_path.exists() or not self.ffmpeg_available:
+            return None
+        duration = self._probe_duration(video_path)
+        if not duration or duration <= 0:
+            print(f"无法获取视频时长，跳过预览拼图: {video_path.name}")
+            return None
+        
+        rows = math.ceil(frames / columns)
+        interval = duration / frames
+        sprite_path, info_path = self.get_sprite_paths(video_path)
+        sprite_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # fps 按 interval 均匀抽帧，tile 拼成一张图
+        vf = (f"fps={frames / duration:.6f},"
+              f"scale={tile_width}:{tile_height}:force_original_aspect_ratio=decrease,"
+              f"pad={tile_width}:{tile_height}:(ow-iw)/2:(oh-ih)/2,"
+              f"tile={columns}x{rows}")
+        cmd = [
+            self.ffmpeg_path, '-v', 'error',
+            '-i', str(video_path),
+            '-vf', vf,
+            '-frames:v', '1',
+            '-y',
+            str(sprite_path)
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        except subprocess.TimeoutExpired:
+            print("生成预览拼图超时")
+            return None
+        if result.returncode != 0 or not is_valid_thumbnail(str(sprite_path)):
+            print(f"生成预览拼图失败: {result.stderr}")
+            return None
+        
+        info = {
+            'version': self.SPRITE_VERSION,
+            'sprite': str(sprite_path),
+            'frames': frames,
+            'columns': columns,
+            'rows': rows,
+            'tile_width': tile_width,
+            'tile_height': tile_height,
+            'interval': interval,
+            'offsets': [
+                {'x': (i % columns) * tile_width, 'y': (i // columns) * tile_height, 'time': round(i * interval, 3)}
+                for i in range(frames)
+            ]
+        }
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False)
+        print(f"成功生成预览拼图: {sprite_path}")
+        return info
+        
+    def load_sprite_info(self, video_path):
+        """
+        读取视频的预览拼图信息
+        
+        Args:
+            video_path (str): 视频文件路径
+            
+        Returns:
+            dict: sprite/frames/columns/rows/tile_width/tile_height/interval/offsets，不存在或版本过旧返回None
+        """
+        sprite_path, info_path = self.get_sprite_paths(video_path)
+        try:
+            with open(info_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if info.get('version') != self.SPRITE_VERSION:
+            return None
+        return info if sprite_path.exists() else None
+        
+    @staticmethod
+    def thumbnail_key(video_path):
+        """
+        计算视频的缩略图键（绝对路径、大小、修改时间的哈希）
+        
+        不同目录下的同名视频得到不同的键，视频被替换后键随之改变。
+        
+        Args:
+            video_path (str): 视频文件路径
+            
+        Returns:
+            str: 十六进制键
+        """
+        abs_path = os.path.abspath(str(video_path))
+        try:
+            st = os.stat(abs_path)
+            size, mtime = st.st_size, st.st_mtime_ns
+        except OSError:
+            size, mtime = 0, 0
+        return hashlib.sha1(f"{abs_path}|{size}|{mtime}".encode('utf-8')).hexdigest()
+        
     def get_thumbnail_path(self, video_path):
         """
         获取视频对应的缩略图路径（不创建）
         
+        缩略图按键的前两位分目录存放：thumbnails/ab/abcdef....jpg
+        
         Args:
             video_path (str): 视频文件路径
             
         Returns:
             str: 缩略图路径
         """
-        video_path = Path(video_path)
-        return str(self.thumbnail_dir / f"{video_path.stem}_thumb.jpg")
+        key = self.thumbnail_key(video_path)
+        return str(self.thumbnail_dir / key[:2] / f"{key}.jpg")
+        
+    def _index_connect(self):
+        """打开缩略图索引数据库"""
+        conn = sqlite3.connect(str(self.thumbnail_dir / "index.db"), timeout=10)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                thumb_key TEXT PRIMARY KEY,
+                video_path TEXT NOT NULL,
+                thumbnail_path TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_thumbnails_video ON thumbnails(video_path)")
+        return conn
+        
+    def _index_thumbnail(self, video_path, thumbnail_path):
+        """把缩略图记入索引"""
+        try:
+            with self._index_connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO thumbnails (thumb_key, video_path, thumbnail_path) VALUES (?, ?, ?)",
+                    (self.thumbnail_key(video_path), os.path.abspath(str(video_path)), str(thumbnail_path))
+                )
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"更新缩略图索引失败: {e}")
         
     def cleanup_orphaned_thumbnails(self, video_files):
         """
         清理孤立的缩略图文件
         
+        以索引中的键与当前视频文件的键做差集，只删除索引记录过的缩略图，不扫描整个目录。
+        
         Args:
             video_files (list): 当前存在的视频文件列表
         """
         try:
-            # 获取所有缩略图文件
-            thumbnail_files = list(self.thumbnail_dir.glob("*_thumb.jpg"))
-            
-            # 构建视频文件名集合
-            video_stems = {Path(vf).stem for vf in video_files}
-            
-            # 删除孤立的缩略图
-            for thumb_file in thumbnail_files:
-                thumb_stem = thumb_file.stem.replace('_thumb', '')
-                if thumb_stem not in video_stems:
+            conn = self._index_connect()
+            try:
+                conn.execute("CREATE TEMP TABLE current_keys (thumb_key TEXT PRIMARY KEY)")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO current_keys VALUES (?)",
+                    ((self.thumbnail_key(vf),) for vf in video_files)
+                )
+                orphans = conn.execute("""
+                    SELECT thumb_key, thumbnail_path FROM thumbnails
+                    WHERE thumb_key NOT IN (SELECT thumb_key FROM current_keys)
+                """).fetchall()
+                
+                # 删除孤立的缩略图及同键的预览拼图
+                removed = []
+                for thumb_key, thumbnail_path in orphans:
                     try:
-                        thumb_file.unlink()
-                        print(f"删除孤立缩略图: {thumb_file}")
+                        if os.path.exists(thumbnail_path):
+                            os.remove(thumbnail_path)
+                            print(f"删除孤立缩略图: {thumbnail_path}")
+                        shard = self.thumbnail_dir / thumb_key[:2]
+                        for sprite_file in (shard / f"{thumb_key}_sprite.jpg", shard / f"{thumb_key}_sprite.json"):
+                            if sprite_file.exists():
+                                sprite_file.unlink()
+                        removed.append((thumb_key,))
                     except Exception as e:
-                        print(f"删除缩略图失败 {thumb_file}: {e}")
+                        print(f"删除缩略图失败 {thumbnail_path}: {e}")
+                        
+                conn.executemany("DELETE FROM thumbnails WHERE thumb_key = ?", removed)
+                conn.commit()
+            finally:
+                conn.close()
                         
         except Exception as e:
             print(f"清理缩略图时出错: {e}")
 
 
+def mp4_layout(data):
+    """
+    根据文件开头的数据判断MP4中 moov 和 mdat 哪个在前
+    
+    Args:
+        data (bytes): 文件开头的数据
+        
+    Returns:
+        str: 'moov' 或 'mdat'；数据不足以判断时返回None；不是MP4返回空字符串
+    """
+    pos = 0
+    while pos + 8 <= len(data):
+        size = int.from_bytes(data[pos:pos + 4], 'big')
+        box = bytes(data[pos + 4:pos + 8])
+        if box in (b'moov', b'mdat'):
+            return box.decode()
+        if pos == 0 and box != b'ftyp':
+            return ''
+        if size == 1:
+            # 64位长度
+            if pos + 16 > len(data):
+                return None
+            size = int.from_bytes(data[pos + 8:pos + 16], 'big')
+        if size < 8:
+            return ''
+        pos += size
+    return None
+
+
+def _find_box(data, name, start=0, end=None):
+    """在 data[start:end] 的同级box中查找 name，返回(内容起点, box终点)；box头不完整或未找到返回None"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size = int.from_bytes(data[pos:pos + 4], 'big')
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return None
+            size = int.from_bytes(data[pos + 8:pos + 16], 'big')
+            header = 16
+        if size < header:
+            return None
+        if bytes(data[pos + 4:pos + 8]) == name:
+            return pos + header, pos + size
+        pos += size
+    return None
+
+
+def mp4_duration(data):
+    """
+    从文件开头的数据中读取 moov/mvhd 记录的视频时长
+    
+    Args:
+        data (bytes): 文件开头的数据
+        
+    Returns:
+        float: 时长（秒）；数据还不够时返回None；没有有效时长返回0
+    """
+    moov = _find_box(data, b'moov')
+    if moov is None:
+        return None
+    mvhd = _find_box(data, b'mvhd', moov[0], min(moov[1], len(data)))
+    if mvhd is None:
+        return None if moov[1] > len(data) else 0
+    body = mvhd[0]
+    if body + 1 > len(data):
+        return None
+    # version 1 的时间字段为64位
+    if data[body] == 1:
+        fields = (body + 20, body + 24, 8)
+    else:
+        fields = (body + 12, body + 16, 4)
+    timescale_at, duration_at, width = fields
+    if duration_at + width > len(data):
+        return None
+    timescale = int.from_bytes(data[timescale_at:timescale_at + 4], 'big')
+    duration = int.from_bytes(data[duration_at:duration_at + width], 'big')
+    if not timescale or duration in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return 0
+    return duration / timescale
+
+
+class StreamThumbnailer:
+    """
+    下载过程中从数据流生成缩略图
+    
+    仅处理 moov 在 mdat 之前的MP4：识别到这种布局后，从 moov 中读出时长，按与常规提取相同的
+    pick_timestamp 规则选择时间点，把文件前若干MB通过管道交给ffmpeg解码该时间点的画面，
+    下载完成时缩略图已经就绪，不必再读取整个文件。其它布局、或估算目标画面超出前缀范围时
+    直接放弃，由下载完成后的常规提取处理。
+    """
+    
+    def __init__(self, extractor, max_prefix=8 * 1024 * 1024, total_size=0):
+        """
+        Args:
+            extractor (ThumbnailExtractor): 缩略图提取器
+            max_prefix (int): 最多交给ffmpeg的字节数
+            total_size (int): 文件总大小（未知为0），用于估算目标画面所在位置
+        """
+        self.extractor = extractor
+        self.max_prefix = max_prefix
+        self.total_size = total_size
+        self.timestamp = None
+        self.state = 'detect'  # detect / streaming / done
+        self.header = bytearray()
+        self.fed = 0
+        self.process = None
+        self.queue = None
+        self.thread = None
+        self.output_path = extractor.thumbnail_dir / f".stream_{os.getpid()}_{id(self)}.jpg"
+        
+    def feed(self, chunk):
+        """接收下载的数据块"""
+        if self.state == 'detect':
+            self.header += chunk
+            layout = mp4_layout(self.header)
+            if layout is None:
+                if len(self.header) > self.max_prefix:
+                    self.close()
+                return
+            if layout != 'moov':
+                self.close()
+                return
+            duration = mp4_duration(self.header)
+            if duration is None:
+                # 等待完整的 mvhd
+                if len(self.header) > self.max_prefix:
+                    self.close()
+                return
+            if not self._pick_timestamp(duration):
+                self.close()
+                return
+            self._start()
+            data, self.header = bytes(self.header), bytearray()
+            self._send(data)
+        elif self.state == 'streaming':
+            self._send(chunk)
+            
+    def _pick_timestamp(self, duration):
+        """
+        按常规提取的规则选择时间点，并估算该画面是否落在前缀范围内
+        
+        Returns:
+            bool: 前缀能覆盖目标画面（或无法估算）时返回True
+        """
+        self.timestamp = self.extractor.pick_timestamp(duration)
+        if not duration or not self.total_size:
+            return True
+        # 按码率均匀估算目标时间点在文件中的位置，留出 moov 之后的数据
+        moov = _find_box(self.header, b'moov')
+        media_start = moov[1] if moov else 0
+        offset = media_start + (self.total_size - media_start) * float(self.timestamp) / duration
+        return offset < self.max_prefix
+        
+    def _start(self):
+        """启动从管道读取的ffmpeg进程"""
+        self.extractor.thumbnail_dir.mkdir(parents=True, exist_ok=True)
+        # 管道输入无法跳转，用输出端 -ss 解码到目标时间点
+        cmd = [
+            self.extractor.ffmpeg_path, '-v', 'error',
+            '-i', 'pipe:0',
+            '-ss', self.timestamp,
+            '-frames:v', '1',
+            '-vf', self.extractor.SCALE_FILTER,
+            '-y',
+            str(self.output_path)
+        ]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._pump, daemon=True)
+        self.thread.start()
+        self.state = 'streaming'
+        
+    def _send(self, data):
+        """把数据交给写入线程，不阻塞下载"""
+        if self.fed >= self.max_prefix or self.process.poll() is not None:
+            return
+        data = data[:self.max_prefix - self.fed]
+        self.fed += len(data)
+        self.queue.put(data)
+        if self.fed >= self.max_prefix:
+            self.queue.put(None)
+            
+    def _pump(self):
+        """写入线程：把数据写入ffmpeg标准输入"""
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+                self.process.stdin.write(data)
+        except OSError:
+            # ffmpeg 取到帧后会提前退出
+            pass
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+                
+    def finish(self, video_path, timeout=10):
+        """
+        下载完成后收尾
+        
+        Args:
+            video_path (str): 下载完成的视频文件路径
+            timeout (float): 等待ffmpeg结束的秒数
+            
+        Returns:
+            str: 缩略图路径，未能生成返回None
+        """
+        if self.state != 'streaming':
+            self.close()
+            return None
+        self.queue.put(None)
+        self.thread.join(timeout)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass
+        self.state = 'done'
+        if is_valid_thumbnail(str(self.output_path)):
+            return self.extractor.adopt_thumbnail(video_path, str(self.output_path))
+        self.close()
+        return None
+        
+    def close(self):
+        """放弃流式生成，结束进程并删除临时文件"""
+        self.state = 'done'
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.header = bytearray()
+        try:
+            self.output_path.unlink()
+        except OSError:
+            pass
+
+
 def main():
     """测试函数"""
     extractor = ThumbnailExtractor()
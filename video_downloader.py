@@ -17,6 +17,12 @@ import urllib3
 import argparse
 import sys
 
+try:
+    from thumbnail_extractor import get_thumbnail_extractor, StreamThumbnailer
+except ImportError:
+    # 缩略图依赖不可用时只下载，不生成缩略图
+    get_thumbnail_extractor = None
+
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -204,6 +210,18 @@ class VideoDownloader:
             print(f"JSON解析错误: {e}")
             return None
     
+    def _create_stream_thumbnailer(self, filename, total_size=0):
+        """为可边下边解码的MP4创建流式缩略图生成器，不适用时返回None"""
+        if get_thumbnail_extractor is None or Path(filename).suffix.lower() not in ('.mp4', '.m4v', '.mov'):
+            return None
+        try:
+            extractor = get_thumbnail_extractor()
+            if extractor.ffmpeg_available:
+                return StreamThumbnailer(extractor, total_size=total_size)
+        except Exception as e:
+            print(f"流式缩略图不可用: {e}")
+        return None
+        
     def download_file(self, url, filename, chunk_size=8192, max_retries=3):
         """
         下载文件
@@ -302,18 +320,30 @@ class VideoDownloader:
                 total_size = int(response.headers.get('content-length', 0))
                 downloaded_size = 0
                 
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=chunk_size):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded_size += len(chunk)
-                            
-                            # 显示下载进度
-                            if total_size > 0:
-                                progress = (downloaded_size / total_size) * 100
-                                print(f"\r下载进度: {progress:.1f}%", end='', flush=True)
-                
-                print(f"\n下载完成: {file_path}")
+                # moov 在前的MP4边下载边生成缩略图
+                stream_thumbnailer = self._create_stream_thumbnailer(filename, total_size)
+                try:
+                    with open(file_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if chunk:
+                                f.write(chunk)
+                                downloaded_size += len(chunk)
+                                if stream_thumbnailer:
+                                    stream_thumbnailer.feed(chunk)
+                                
+                                # 显示下载进度
+                                if total_size > 0:
+                                    progress = (downloaded_size / total_size) * 100
+                                    print(f"\r下载进度: {progress:.1f}%", end='', flush=True)
+                    
+                    print(f"\n下载完成: {file_path}")
+                    if stream_thumbnailer:
+                        thumbnail_path = stream_thumbnailer.finish(str(file_path))
+                        if thumbnail_path:
+                            print(f"流式缩略图: {thumbnail_path}")
+                finally:
+                    if stream_thumbnailer:
+                        stream_thumbnailer.close()
                 return True
                 
             except requests.exceptions.HTTPError as e:
@@ -23,7 +23,7 @@ from PyQt5.QtWidgets import QApplication
 from video_downloader import VideoDownloader
 from history_manager import HistoryManager
 from history_widget import HistoryWidget
-from thumbnail_extractor import ThumbnailExtractor
+from thumbnail_extractor import get_thumbnail_extractor, is_valid_thumbnail
 
 def set_application_icon(app_or_widget=None):
     """
@@ -81,8 +81,8 @@ class DownloadWorker(QThread):
         self.history_manager = history_manager
         self.history_record_id = existing_record_id  # 历史记录ID，可能是现有的
         
-        # 初始化缩略图提取器
-        self.thumbnail_extractor = ThumbnailExtractor()
+        # 共享缩略图提取器（ffmpeg能力在首次提取时探测）
+        self.thumbnail_extractor = get_thumbnail_extractor()
         
         # 如果没有现有记录ID，则创建新的历史记录条目
         if not existing_record_id:
@@ -187,6 +187,13 @@ class DownloadWorker(QThread):
             elif "youtube" in line.lower():
                 self.platform = "YouTube"
             
+            # 解析下载过程中生成的缩略图（对应最近一个下载完成的文件）
+            if line.startswith("流式缩略图:"):
+                thumbnail_path = line.split(":", 1)[1].strip()
+                if self.downloaded_files and is_valid_thumbnail(thumbnail_path):
+                    self.downloaded_files[-1]['thumbnail'] = thumbnail_path
+                return
+            
             # 解析下载文件路径
             if "保存到:" in line or "Saved to:" in line or "下载完成:" in line:
                 file_match = re.search(r'(?:保存到|Saved to|下载完成)[:：]\s*(.+)', line)
@@ -244,8 +251,8 @@ class DownloadWorker(QThread):
             if not self.history_manager or not self.history_record_id:
                 return
                 
-            # 更新现有记录状态为downloading
-            self.history_manager.update_record(
+            # 更新现有记录状态为downloading（后写队列批量提交）
+            self.history_manager.update_record_async(
                 self.history_record_id,
                 status='downloading',
                 download_time=time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -289,33 +296,17 @@ class DownloadWorker(QThread):
             # 只有在下载成功且有下载文件时，才更新文件信息
             if success and self.downloaded_files:
                 file_info = self.downloaded_files[0]  # 取第一个文件
-                # 实际提取缩略图
-                thumbnail_path = None
-                video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v']
-                if any(file_info['path'].lower().endswith(ext) for ext in video_extensions):
-                    print(f"正在为 {file_info['name']} 提取缩略图...")
-                    thumbnail_path = self.thumbnail_extractor.extract_thumbnail(file_info['path'])
-                    print(f"缩略图提取结果: {thumbnail_path}")
-                else:
-                    print(f"文件 {file_info['name']} 不是视频文件，跳过缩略图提取")
-                
                 update_data.update({
                     'file_path': file_info['path'],
                     'file_name': file_info['name'],
                     'file_size': file_info['size'],
-                    'thumbnail_path': thumbnail_path
+                    'thumbnail_path': self._thumbnail_for(file_info)
                 })
                 
                 # 如果有多个文件，为其他文件创建新记录
                 for file_info in self.downloaded_files[1:]:
-                    # 为每个额外文件也提取缩略图
-                    thumbnail_path = None
-                    if any(file_info['path'].lower().endswith(ext) for ext in video_extensions):
-                        print(f"正在为 {file_info['name']} 提取缩略图...")
-                        thumbnail_path = self.thumbnail_extractor.extract_thumbnail(file_info['path'])
-                        print(f"缩略图提取结果: {thumbnail_path}")
-                    
-                    self.history_manager.add_record(
+                    thumbnail_path = self._thumbnail_for(file_info)
+                    self.history_manager.add_record_async(
                         url=self.url,
                         title=self.video_title or self.task_name,
                         file_path=file_info['path'],
@@ -326,10 +317,9 @@ class DownloadWorker(QThread):
                         platform=self.platform or "未知平台"
                     )
             
-            # 更新主记录
+            # 更新主记录（后写队列批量提交，读取方会先等待队列落盘）
             print(f"正在更新历史记录 ID {self.history_record_id}: {update_data}")
-            result = self.history_manager.update_record(self.history_record_id, **update_data)
-            print(f"历史记录更新结果: {result}")
+            self.history_manager.update_record_async(self.history_record_id, **update_data)
             
             # 发出状态变化信号
             self.status_changed_signal.emit()
@@ -348,20 +338,33 @@ class DownloadWorker(QThread):
             
             # 为每个下载的视频文件提取缩略图
             for file_info in self.downloaded_files:
-                file_path = file_info['path']
-                # 检查是否为视频文件
-                video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v']
-                if any(file_path.lower().endswith(ext) for ext in video_extensions):
-                    # 检查缩略图是否已存在
-                    thumbnail_path = self.thumbnail_extractor.get_thumbnail_path(file_path)
-                    if not os.path.exists(thumbnail_path):
-                        self.progress_signal.emit(f"[{self.task_name}] 正在提取缩略图: {Path(file_path).name}")
-                        self.thumbnail_extractor.extract_thumbnail(file_path)
-                    else:
-                        print(f"缩略图已存在，跳过提取: {thumbnail_path}")
+                self._thumbnail_for(file_info)
         except Exception as e:
             print(f"提取缩略图时出错: {e}")
     
+    def _thumbnail_for(self, file_info):
+        """获取文件的缩略图（每个文件只提取一次，优先使用下载过程中已生成的缩略图）"""
+        if 'thumbnail' in file_info:
+            return file_info['thumbnail']
+        
+        thumbnail_path = None
+        file_path = file_info['path']
+        video_extensions = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v')
+        if file_path.lower().endswith(video_extensions):
+            # 检查缩略图是否已存在
+            existing = self.thumbnail_extractor.get_thumbnail_path(file_path)
+            if is_valid_thumbnail(existing):
+                print(f"缩略图已存在，跳过提取: {existing}")
+                thumbnail_path = existing
+            else:
+                self.progress_signal.emit(f"[{self.task_name}] 正在提取缩略图: {Path(file_path).name}")
+                thumbnail_path = self.thumbnail_extractor.extract_thumbnail(file_path)
+        else:
+            print(f"文件 {file_info['name']} 不是视频文件，跳过缩略图提取")
+        
+        file_info['thumbnail'] = thumbnail_path
+        return thumbnail_path
+    
     def _find_downloaded_files(self):
         """从下载目录查找可能的下载文件"""
         try:
@@ -1381,12 +1384,16 @@ class VideoDownloaderGUI(QMainWindow):
                 self.stop_download()
                 # 保存设置
                 self.save_settings()
+                # 写入尚未提交的历史记录
+                self.history_manager.flush_pending()
                 event.accept()
             else:
                 event.ignore()
         else:
             # 保存设置
             self.save_settings()
+            # 写入尚未提交的历史记录
+            self.history_manager.flush_pending()
             event.accept()
     
     def mousePressEvent(self, event: QMouseEvent):